@@ -1,133 +1,397 @@
 # custom_logger.py
+import atexit
 import logging
+import os
+import queue
+import select
+import selectors
 import subprocess
 import time
 import sys
+import threading
 from datetime import datetime
 from typing import Any
+from collections import deque
 from contextlib import suppress
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from utils import ProbeData, StreamDict
 
+__all__ = ["BufferedFileHandler", "CustomLogger", "use_log_file"]
+
+
+class _JoinedCommand:
+    """Log argument that defers joining a command line until the record is actually formatted"""
+
+    __slots__ = ("_cmd",)
+
+    def __init__(self, cmd: list[str]) -> None:
+        self._cmd = cmd
+
+    def __str__(self) -> str:
+        return " ".join(self._cmd)  # Command arguments are always str (they are passed to subprocess)
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that keeps formatted records in a bounded in-memory ring and writes them to disk in
+    batches, one os.write per flush instead of one write per record. A failed write (full disk, EIO)
+    leaves the records in the ring to be retried on the next flush rather than dropping them.
+    """
+
+    ring_size: int = 4096
+
+    def __init__(
+        self,
+        filename: str,
+        mode: str = "a",
+        encoding: str | None = None,
+        delay: bool = False,
+        errors: str | None = None,
+    ) -> None:
+        self._ring: deque[str] = deque(maxlen=self.ring_size)
+        super().__init__(filename, mode, encoding, delay, errors)
+
+    def _open(self) -> Any:
+        # Records are encoded by flush_now, so the file itself is a raw unbuffered fd
+        return open(self.baseFilename, self.mode + "b", buffering=0)  # noqa: PTH123, SIM115
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # A failed write must not escape emit(), it would kill the listener thread; the ring keeps the records
+        try:
+            self._ring.append(self.format(record) + self.terminator)
+            if record.levelno >= logging.WARNING:
+                self.flush_now()  # Warnings and errors still hit the disk immediately
+            elif len(self._ring) == self._ring.maxlen:
+                self.flush_now(sync=False)  # A full ring would start dropping the oldest records on the next append
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        """Per-record flush is a no-op, buffered records are written by flush_now()"""
+
+    def flush_now(self, sync: bool = True) -> None:
+        """Write buffered records to disk in one batch, then fsync the log file if sync is set"""
+        with self.lock:  # type: ignore
+            if not self._ring:
+                return
+            if self.stream is None:
+                self.stream = self._open()
+            blob = memoryview("".join(self._ring).encode(self.encoding or "utf-8", self.errors or "strict"))
+            fd = self.stream.fileno()
+            while blob:
+                blob = blob[os.write(fd, blob) :]
+            self._ring.clear()
+            if sync:
+                os.fsync(fd)
+
+    def close(self) -> None:
+        with suppress(OSError, ValueError):
+            self.flush_now()
+        super().close()
+
+
+def _communicate_for_exit(process: subprocess.Popen[bytes], timeout: float) -> str:
+    """Portable fallback, returns the captured stderr output"""
+    _stdout, stderr = process.communicate(timeout=timeout)
+    return stderr.decode("utf-8", errors="replace") if stderr else ""
+
+
+# Child-exit wait used by log_verification, picked once per platform
+if sys.platform == "linux":
+
+    def _wait_for_exit(process: subprocess.Popen[bytes], timeout: float) -> str:
+        """
+        Wait for the process to exit while draining its pipes, using a single selector over a pidfd
+        and the raw pipe fds instead of communicate()'s polling/threads (Linux only).
+
+        Returns:
+            str: The decoded stderr output (a piped stdout is drained and discarded)
+        Raises:
+            subprocess.TimeoutExpired: If the process is still running after timeout seconds
+        """
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except OSError:  # Kernel before 5.3, or a sandbox that blocks the syscall
+            return _communicate_for_exit(process, timeout)
+        deadline = time.monotonic() + timeout
+        stderr_chunks: list[bytes] = []
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(pidfd, selectors.EVENT_READ)
+                for pipe in (process.stdout, process.stderr):
+                    if pipe is not None:
+                        selector.register(pipe.fileno(), selectors.EVENT_READ)
+                stderr_fd = process.stderr.fileno() if process.stderr is not None else -1
+
+                while selector.get_map():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(process.args, timeout)
+
+                    for key, _events in selector.select(remaining):
+                        if key.fd == pidfd:
+                            selector.unregister(pidfd)  # Exited, keep draining whatever is left in the pipes
+                            continue
+                        chunk = os.read(key.fd, 65536)
+                        if not chunk:
+                            selector.unregister(key.fd)
+                        elif key.fd == stderr_fd:
+                            stderr_chunks.append(chunk)
+        finally:
+            os.close(pidfd)
+
+        process.wait()  # Child already exited, this only reaps it and sets returncode
+        return b"".join(stderr_chunks).decode("utf-8", errors="replace")
+
+elif sys.platform == "darwin" or sys.platform.startswith("freebsd"):
+
+    def _wait_for_exit(process: subprocess.Popen[bytes], timeout: float) -> str:
+        """
+        Wait for the process to exit while draining its pipes, using one kqueue that watches both the
+        child's exit (EVFILT_PROC) and the raw pipe fds, so every wakeup is output to drain or the exit itself.
+
+        Returns:
+            str: The decoded stderr output (a piped stdout is drained and discarded)
+        Raises:
+            subprocess.TimeoutExpired: If the process is still running after timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        stderr_chunks: list[bytes] = []
+        pipe_fds = {pipe.fileno() for pipe in (process.stdout, process.stderr) if pipe is not None}
+        stderr_fd = process.stderr.fileno() if process.stderr is not None else -1
+
+        kq = select.kqueue()
+        try:
+            kq.control(
+                [select.kevent(fd, filter=select.KQ_FILTER_READ, flags=select.KQ_EV_ADD) for fd in pipe_fds],
+                0,
+            )
+            exited = False
+            try:
+                proc_event = select.kevent(
+                    process.pid,
+                    filter=select.KQ_FILTER_PROC,
+                    flags=select.KQ_EV_ADD | select.KQ_EV_ONESHOT,
+                    fflags=select.KQ_NOTE_EXIT,
+                )
+                kq.control([proc_event], 0)
+            except ProcessLookupError:
+                exited = True  # Already exiting, only the pipes are left to drain
+
+            while not exited or pipe_fds:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(process.args, timeout)
+
+                for event in kq.control(None, len(pipe_fds) + 1, remaining):
+                    if event.filter == select.KQ_FILTER_PROC:
+                        exited = True
+                        continue
+                    chunk = os.read(event.ident, 65536)
+                    if not chunk:
+                        kq.control(
+                            [select.kevent(event.ident, filter=select.KQ_FILTER_READ, flags=select.KQ_EV_DELETE)],
+                            0,
+                        )
+                        pipe_fds.discard(event.ident)
+                    elif event.ident == stderr_fd:
+                        stderr_chunks.append(chunk)
+        finally:
+            kq.close()
+
+        process.wait()  # Child already exited, this only reaps it and sets returncode
+        return b"".join(stderr_chunks).decode("utf-8", errors="replace")
+
+else:
+    _wait_for_exit = _communicate_for_exit
+
+
+class _LogPipeline:
+    """Process-wide QueueListener that owns the real handlers, plus the periodic flush thread"""
+
+    def __init__(self, *handlers: logging.Handler, flush_interval: int) -> None:
+        self.queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        self.flush_interval = flush_interval
+        self._listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self._running = False
+        self._stop_event = threading.Event()
+        self._flush_thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._listener.start()
+        self._running = True
+        self._flush_thread = threading.Thread(target=self._periodic_flush, name="log-flush", daemon=True)
+        self._flush_thread.start()
+        atexit.register(self.stop)
+
+    def _periodic_flush(self) -> None:
+        """Flush buffered handlers every flush_interval seconds until stop() is called"""
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self, sync: bool = False) -> None:
+        """
+        Write out buffered file records, only paying for fsync when sync is set. Warnings and errors
+        already force an fsync'd flush from the file handler itself, and the stream handler flushes
+        every record on its own.
+        """
+        for handler in self._listener.handlers:
+            if isinstance(handler, BufferedFileHandler):
+                with suppress(OSError, ValueError):
+                    handler.flush_now(sync=sync)
+
+    def stop(self) -> None:
+        """Drain pending records and stop the listener thread (safe to call more than once)"""
+        if self._running:
+            self._running = False
+            self._stop_event.set()
+            if self._flush_thread is not None:
+                self._flush_thread.join()
+            self._listener.stop()
+            self.flush(sync=True)
+
+
+# Rough encode-time estimate: 24 frames per second of video at ~0.018s per frame, in minutes.
+# This may vary based on the specifics of the default encoding process
+_ESTIMATED_ENCODE_MINUTES_PER_SECOND: float = 24 * 0.018 / 60
+
+# One log file, handler set and listener thread per process, shared by every CustomLogger
+_LOG_FILE = f"encoding_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+
+_FORMATTER = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+
+# Stream handler setup (exactly as original)
+_STREAM_HANDLER = logging.StreamHandler(sys.stdout)
+_STREAM_HANDLER.setFormatter(_FORMATTER)
+
+# File handler setup (maintaining original filename format), the file is only created once a record is written,
+# so importing the module (e.g. from tests or for --help) leaves no empty log behind
+_FILE_HANDLER = BufferedFileHandler(_LOG_FILE, encoding="utf-8", delay=True)
+_FILE_HANDLER.setFormatter(_FORMATTER)
+
+_PIPELINE = _LogPipeline(_STREAM_HANDLER, _FILE_HANDLER, flush_interval=1)  # Drain the log file ring every second
+_PIPELINE.start()
+
+
+def use_log_file(log_file: str) -> None:
+    """Point the shared file handler at another log, used as the batch pool initializer so workers append to the
+    parent's file instead of starting their own"""
+    global _LOG_FILE  # noqa: PLW0603
+    with _FILE_HANDLER.lock:  # type: ignore
+        _FILE_HANDLER.flush_now()
+        if _FILE_HANDLER.stream is not None:
+            _FILE_HANDLER.stream.close()
+            _FILE_HANDLER.stream = None  # Reopened lazily, the handler uses delay=True
+        _FILE_HANDLER.baseFilename = os.path.abspath(log_file)
+        _LOG_FILE = log_file
+
 
 class CustomLogger(logging.Logger):
     def __init__(self, name: str) -> None:
         super().__init__(name)
         self.setLevel(logging.INFO)
+        self.frame_log_interval_ns: int = 60 * 1_000_000_000  # Log frame progress every 60 seconds
+        self._next_frame_log_ns: int | None = None  # Monotonic deadline, armed by the first log_frame call
         self._setup_handlers()
-        self.last_flush = time.time()
-        self.flush_interval: int = 30  # 30 seconds default flush interval
         self._max_log_size: int = 10 * 1024 * 1024  # 10MB default, hidden implementation detail
 
     def _setup_handlers(self) -> None:
-        """Setup handlers maintaining original behavior but with internal improvements"""
-        # Stream handler setup (exactly as original)
-        stream_handler = logging.StreamHandler(sys.stdout)
-        stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-        self.addHandler(stream_handler)
-
-        # File handler setup (maintaining original filename format)
-        self.log_file = f"encoding_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-        file_handler = logging.FileHandler(self.log_file, encoding="utf-8")
-        file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-        self.addHandler(file_handler)
-
-    def _should_flush(self) -> bool:
-        """Internal method for flush control"""
-        current_time = time.time()
-        if (current_time - self.last_flush) >= self.flush_interval:
-            self.last_flush = current_time
-            return True
-        return False
-
-    def info(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        """Maintains original interface but with controlled flushing"""
-        super().info(msg, *args, **kwargs)
-        if self._should_flush():
-            self._flush_handlers()
-
-    def warning(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        """Maintains original interface but with immediate flush"""
-        super().warning(msg, *args, **kwargs)
-        self._flush_handlers()  # Always flush warnings
-
-    def error(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        """Maintains original interface but with immediate flush"""
-        super().error(msg, *args, **kwargs)
-        self._flush_handlers()  # Always flush errors
-
-    def _flush_handlers(self) -> None:
-        """Internal method for controlled flushing"""
-        for handler in self.handlers:
-            with suppress(OSError):
-                handler.flush()
+        """Attach to the shared log pipeline, the calling thread only enqueues records"""
+        self.log_file = _LOG_FILE
+        self.addHandler(QueueHandler(_PIPELINE.queue))
 
     def log_frame(self, frame: str) -> None:
-        """Logs frame information, but only logs every 30 seconds."""
-        seconds: int = 60  # Log every 60 seconds
-        current_time = time.time()
-        if not hasattr(self, "last_frame_log_time"):
-            self.last_frame_log_time = current_time
-        if current_time - self.last_frame_log_time >= seconds:
-            self.info(f"Frame: {frame}")
-            self.last_frame_log_time = current_time
+        """Logs frame information, but only logs every 60 seconds."""
+        now = time.monotonic_ns()
+        if self._next_frame_log_ns is None:
+            self._next_frame_log_ns = now + self.frame_log_interval_ns
+        elif now >= self._next_frame_log_ns:
+            self.info("Frame: %s", frame)
+            self._next_frame_log_ns = now + self.frame_log_interval_ns
 
     def log_input_analysis(self, probe_data: ProbeData) -> None:
-        """Maintains exact original interface and output format"""
+        """Maintains original interface, emits the whole report as a single record"""
         streams: list[StreamDict] | None = probe_data.get("streams")
         if streams is None:
             self.error("Invalid probe data format")
             return
 
-        video_stream = next((s for s in probe_data["streams"] if s.get("codec_type") == "video"), None)
+        if not self.isEnabledFor(logging.INFO):
+            return  # Skip building the report when it would be dropped anyway
+
+        # Bucket streams by type in a single pass
+        buckets: dict[str, list[StreamDict]] = {"video": [], "audio": [], "subtitle": []}
+        for stream in streams:
+            bucket = buckets.get(stream.get("codec_type", ""))
+            if bucket is not None:
+                bucket.append(stream)
+
+        # Build the whole report first and emit it as a single record
+        parts: list[str] = []
+        video_stream = buckets["video"][0] if buckets["video"] else None
         if video_stream:
-            self.info("Video Stream Information:")
-            self.info(f"Codec: {video_stream.get('codec_name', 'unknown')}")
-            self.info(f"Resolution: {video_stream.get('width', '?')}x{video_stream.get('height', '?')}")
-            self.info(f"Pixel Format: {video_stream.get('pix_fmt', 'unknown')}")
-            self.info(f"Color Space: {video_stream.get('color_space', 'unknown')}")
-            self.info(f"Color Transfer: {video_stream.get('color_transfer', 'unknown')}")
-            self.info(f"Frame Rate: {video_stream.get('r_frame_rate', 'unknown')}")
-            self.info(f"Bit Depth: {video_stream.get('bits_per_raw_sample', 'unknown')}")
-
-        audio_streams = [s for s in probe_data["streams"] if s.get("codec_type") == "audio"]
-        self.info(f"\nFound {len(audio_streams)} audio stream(s):")
-        for idx, stream in enumerate(audio_streams):
-            language = stream.get("tags", {}).get("language", "unknown")
-            codec = stream.get("codec_name", "unknown")
-            channels = stream.get("channels", "unknown")
-            self.info(f"Audio Stream {idx + 1}: {codec}, {channels} channels, Language: {language}")
-
-        subtitle_streams = [s for s in probe_data["streams"] if s.get("codec_type") == "subtitle"]
-        self.info(f"\nFound {len(subtitle_streams)} subtitle stream(s):")
-        for idx, stream in enumerate(subtitle_streams):
-            language = stream.get("tags", {}).get("language", "unknown")
-            codec = stream.get("codec_name", "unknown")
-            self.info(f"Subtitle Stream {idx + 1}: {codec}, Language: {language}")
+            parts.extend(
+                (
+                    "Video Stream Information:",
+                    f"Codec: {video_stream.get('codec_name', 'unknown')}",
+                    f"Resolution: {video_stream.get('width', '?')}x{video_stream.get('height', '?')}",
+                    f"Pixel Format: {video_stream.get('pix_fmt', 'unknown')}",
+                    f"Color Space: {video_stream.get('color_space', 'unknown')}",
+                    f"Color Transfer: {video_stream.get('color_transfer', 'unknown')}",
+                    f"Frame Rate: {video_stream.get('r_frame_rate', 'unknown')}",
+                    f"Bit Depth: {video_stream.get('bits_per_raw_sample', 'unknown')}",
+                ),
+            )
+
+        audio_streams = buckets["audio"]
+        parts.append(f"\nFound {len(audio_streams)} audio stream(s):")
+        parts.extend(
+            f"Audio Stream {idx + 1}: {stream.get('codec_name', 'unknown')}, "
+            f"{stream.get('channels', 'unknown')} channels, "
+            f"Language: {stream.get('tags', {}).get('language', 'unknown')}"
+            for idx, stream in enumerate(audio_streams)
+        )
+
+        subtitle_streams = buckets["subtitle"]
+        parts.append(f"\nFound {len(subtitle_streams)} subtitle stream(s):")
+        parts.extend(
+            f"Subtitle Stream {idx + 1}: {stream.get('codec_name', 'unknown')}, "
+            f"Language: {stream.get('tags', {}).get('language', 'unknown')}"
+            for idx, stream in enumerate(subtitle_streams)
+        )
+
+        self.info("\n".join(parts))
 
     def log_encoding_start(self, output_file: Path, target_bitrate: float, cmd: list[str]) -> None:
         """Maintains exact original interface"""
         self.info("\n=== Starting Encoding Process ===")
-        self.info(f"Output File: {output_file}")
-        self.info(f"Target Bitrate: {target_bitrate / 1_000_000:.2f} Mbps")
-        self.info("FFmpeg Command:")
-        self.info(" ".join(str(c) for c in cmd))
+        self.info("Output File: %s", output_file)
+        self.info("Target Bitrate: %.2f Mbps", target_bitrate / 1_000_000)
+        self.info("FFmpeg Command: %s", _JoinedCommand(cmd))
 
-    def log_encoding_complete(self, input_file: Path, output_file: Path, encoding_duration: float) -> None:
-        """Maintains exact original interface with improved error handling"""
+    def log_encoding_complete(
+        self,
+        input_file: Path,
+        output_file: Path,
+        encoding_duration: float,
+        input_bytes: int | None = None,
+    ) -> None:
+        """Maintains exact original interface with improved error handling, input_bytes skips re-stat'ing the input"""
         try:
-            input_size = input_file.stat().st_size / (1024 * 1024 * 1024)  # GB
-            output_size = output_file.stat().st_size / (1024 * 1024 * 1024)  # GB
+            input_size = (input_file.stat().st_size if input_bytes is None else input_bytes) / (1 << 30)  # GB
+            output_size = output_file.stat().st_size / (1 << 30)  # GB
             compression_ratio = input_size / output_size if output_size > 0 else 0
+            encoding_minutes = max(encoding_duration / 60, 1e-9)  # Guard against a zero duration
 
             self.info("\n=== Encoding Complete ===")
-            self.info(f"Input Size: {input_size:.2f} GB")
-            self.info(f"Output Size: {output_size:.2f} GB")
-            self.info(f"Compression Ratio: {compression_ratio:.2f}:1")
-            self.info(f"Encoding Duration: {encoding_duration / 3600:.2f} hours")
-            self.info(f"Average Processing Speed: {(input_size * 1024) / (encoding_duration / 60):.2f} MB/minute")
-        except (OSError, ZeroDivisionError) as e:
-            self.error(f"Error calculating file statistics: {e!s}")
+            self.info("Input Size: %.2f GB", input_size)
+            self.info("Output Size: %.2f GB", output_size)
+            self.info("Compression Ratio: %.2f:1", compression_ratio)
+            self.info("Encoding Duration: %.2f hours", encoding_duration / 3600)
+            self.info("Average Processing Speed: %.2f MB/minute", (input_size * 1024) / encoding_minutes)
+        except OSError as e:
+            self.error("Error calculating file statistics: %s", e)
 
     def log_verification(self, output_file: Path) -> None:
         """Maintains original interface with improved subprocess handling"""
@@ -143,14 +407,15 @@ class CustomLogger(logging.Logger):
 
         try:
             # Use subprocess with timeout and proper cleanup
-            process = subprocess.Popen(verify_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            # Only stderr is inspected, so stdout is discarded by the kernel instead of piped back
+            process = subprocess.Popen(verify_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
 
             try:
-                _stdout, stderr = process.communicate(timeout=300)  # 5-minute timeout
+                stderr = _wait_for_exit(process, timeout=300)  # 5-minute timeout
 
                 if process.returncode != 0:
                     self.error("Output file verification: FAILED")
-                    self.error(f"Return code: {process.returncode}")
+                    self.error("Return code: %s", process.returncode)
                     if stderr:
                         self.error(stderr.strip())
                 elif stderr:
@@ -161,26 +426,21 @@ class CustomLogger(logging.Logger):
 
             except subprocess.TimeoutExpired:
                 process.kill()
-                _stdout, stderr = process.communicate()
+                process.communicate()
                 self.error("Verification process timed out")
 
         except Exception as e:
-            self.error(f"Verification error: {e!s}")
+            self.error("Verification error: %s", e)
 
     def log_final_stats(self, start_time: float) -> None:
         """Maintains exact original interface"""
         total_duration = time.time() - start_time
-        self.info(f"\nTotal Processing Time: {total_duration / 3600:.2f} hours")
+        self.info("\nTotal Processing Time: %.2f hours", total_duration / 3600)
         self.info("=== Processing Completed Successfully ===")
 
     def log_estimated_duration(self, duration: float) -> None:
-        total_frames_guess: int = int(duration * 24)
-        avg_time_per_frame: float = (
-            0.018  # This is a rough estimate and may vary based on the specifics of the default encoding process
-        )
-        estimated_time_in_seconds: float = total_frames_guess * avg_time_per_frame
-        estimated_time_in_mins: float = estimated_time_in_seconds / 60
-        self.info(f"Estimated time for encoding: {estimated_time_in_mins:.2f} minutes")
+        estimated_time_in_mins: float = duration * _ESTIMATED_ENCODE_MINUTES_PER_SECOND
+        self.info("Estimated time for encoding: %.2f minutes", estimated_time_in_mins)
 
     def __del__(self) -> None:
         """Clean up resources on deletion"""
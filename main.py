@@ -1,151 +1,361 @@
 # main.py
+import dataclasses
+import functools
+import json
+import logging
+import multiprocessing
+import signal
 import subprocess
+import tempfile
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import suppress
 from pathlib import Path
 import os
 import argparse
-from dotenv import load_dotenv
-from env_file_handler import check_env_file
+from types import FrameType
+from typing import Any
 from video_processor import VideoProcessor
-from custom_logger import CustomLogger as Logger
-from validate import validate_encoding_setup
-from utils import EncodingPreset, EncodingConfig, EncodingPresetVideotoolbox
+from custom_logger import CustomLogger as Logger, use_log_file
+from validate import VIDEO_EXTENSIONS, validate_encoding_setup
+from utils import EncodingPreset, EncodingConfig, EncodingPresetVideotoolbox, EncodingError, find_tool
 
 
 # Create a custom logger
 logger = Logger(__name__)
 
+# Optimized default configuration, --config and --target-size override individual fields
+DEFAULT_CONFIG = EncodingConfig(
+    target_size_gb=4.0,
+    maintain_dolby_vision=True,
+    copy_audio=True,
+    copy_subtitles=True,
+    english_audio_only=True,
+    english_subtitles_only=True,
+    use_hardware_acceleration=True,
+    hardware_encoder="hevc_videotoolbox",
+    quality_preset=EncodingPresetVideotoolbox.SLOW,
+    allow_sw_fallback=True,
+    realtime="false",
+    min_video_bitrate=8_000_000,  # 8 Mbps
+    max_video_bitrate=30_000_000,  # 30 Mbps
+    b_frames="4",
+    profile_v="main10",
+    max_ref_frames="6",
+    group_of_pictures="120",
+    # extra params
+    audio_bitrate="768k",  # Specify the bitrate for the TrueHD stream
+    audio_codec="eac3",  # this is a backup if audio copy doesnt work
+    audio_channel="6",  # Set to 8 for 7.1 surround sound # TODO: make this work
+    # x265 params (only when videotoolbox doesnt work)
+    preset=EncodingPreset.VERYSLOW,
+    hdr_params={
+        "max_cll": "1600,400",
+        "master_display": "G(13250,34500)B(7500,3000)R(34000,16000)WP(15635,16450)L(10000000,50)",
+    },
+)
 
-def get_file_paths() -> tuple[Path, Path]:
+# Version banners keyed by tool path, re-probed only when the binary's mtime changes
+TOOL_VERSION_CACHE = Path.home() / ".cache" / "bd-remux" / "tool_versions.json"
+_TOOL_VERSION_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _load_tool_version_cache() -> dict[str, dict[str, str | int]]:
+    try:
+        cache: dict[str, dict[str, str | int]] = json.loads(TOOL_VERSION_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return cache
+
+
+def get_tool_version(tool: str) -> str:
     """
-    Get input and output file paths. For command line input, output path is automatically
-    generated in a 'finished' subdirectory. For environment variables, both paths must be specified.
+    Get the first line of `tool -version`, served from an on-disk cache while the binary is unchanged.
+
+    Args:
+        tool (str): Name of the executable to look up in PATH
 
     Returns:
-        tuple[Path, Path]: Input file path and output file path
+        str: The version banner line
+    Raises:
+        FileNotFoundError: If the tool is not in PATH
     """
+    tool_path = find_tool(tool)
+    mtime_ns = Path(tool_path).stat().st_mtime_ns
+
+    cache = _load_tool_version_cache()
+    entry = cache.get(tool_path)
+    if entry is not None and entry.get("mtime_ns") == mtime_ns:
+        return str(entry["version"])
+
+    # Only the first line is needed, closing the pipe early ends the tool before it prints the rest
+    with subprocess.Popen([tool_path, "-version"], stdout=subprocess.PIPE, text=True) as process:
+        version = process.stdout.readline().rstrip("\n") if process.stdout else ""
+    # process_file checks ffmpeg and ffprobe from two threads, which share the cached dict
+    with _TOOL_VERSION_LOCK, suppress(OSError):  # The cache is only an optimization, never fail the run over it
+        cache[tool_path] = {"mtime_ns": mtime_ns, "version": version}
+        TOOL_VERSION_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so concurrent runs never see a partially written cache
+        with tempfile.NamedTemporaryFile(
+            "w",
+            dir=TOOL_VERSION_CACHE.parent,
+            suffix=".tmp",
+            delete=False,
+            encoding="utf-8",
+        ) as f:
+            json.dump(cache, f, indent=2)
+        Path(f.name).replace(TOOL_VERSION_CACHE)
+    return version
+
+
+def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Process and encode video files")
-    parser.add_argument("--input", "-i", help="Input video file path")
-    args = parser.parse_args()
+    parser.add_argument("--input", "-i", help="Input video file path, or a directory of video files")
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help="Number of files to encode in parallel (default: 2 for a directory, otherwise 1)",
+    )
+    parser.add_argument(
+        "--threads-per-job",
+        type=int,
+        help="Software encoder threads per parallel job (default: CPU cores divided by jobs)",
+    )
+    parser.add_argument("--config", "-c", help="TOML file with EncodingConfig fields to override (Python 3.11+)")
+    parser.add_argument("--target-size", type=float, help="Target output size in GB")
+    return parser.parse_args()
+
+
+def load_config(args: argparse.Namespace) -> EncodingConfig:
+    """
+    Build the encoding configuration from DEFAULT_CONFIG, applying overrides from the --config TOML
+    file and then --target-size.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments
+
+    Returns:
+        EncodingConfig: The resulting configuration
+    """
+    overrides: dict[str, Any] = {}
+    if args.config:
+        import tomllib  # noqa: PLC0415
 
-    # If command line input is provided, use it and create output path
+        with Path(args.config).open("rb") as f:
+            overrides.update(tomllib.load(f))
+    if args.target_size is not None:
+        overrides["target_size_gb"] = args.target_size
+
+    try:
+        return dataclasses.replace(DEFAULT_CONFIG, **overrides)
+    except TypeError as e:  # Unknown key in the TOML file
+        raise ValueError(f"Invalid configuration override: {e}") from e
+
+
+def get_file_paths(args: argparse.Namespace) -> list[tuple[Path, Path]]:
+    """
+    Get input and output file paths. For command line input, output paths are automatically
+    generated in a 'finished' subdirectory, and a directory input yields every video file in it.
+    For environment variables, both paths must be specified.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments
+
+    Returns:
+        list[tuple[Path, Path]]: Input file path and output file path pairs
+    """
+    # If command line input is provided, use it and create output paths
     if args.input:
         input_path = Path(args.input).resolve()
-        # Create output directory as 'finished' in the same directory as input file
-        output_dir = input_path.parent / "finished"
+        if input_path.is_dir():
+            input_files = sorted(
+                path for path in input_path.iterdir() if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS
+            )
+            output_dir = input_path / "finished"
+        else:
+            input_files = [input_path]
+            # Create output directory as 'finished' in the same directory as input file
+            output_dir = input_path.parent / "finished"
         output_dir.mkdir(parents=True, exist_ok=True)
         # Use same filename in the output directory
-        output_path = output_dir / input_path.name
-        return input_path, output_path
+        return [(input_file, output_dir / input_file.name) for input_file in input_files]
 
     # Otherwise, fall back to environment variables
     logger.info("No command line arguments provided, falling back to environment variables")
-    check_env_file()
-    load_dotenv()
+    # Only needed on this path, so not imported at startup
+    from dotenv import dotenv_values  # noqa: PLC0415
 
-    input_file_path = os.getenv("INPUT_FILE")
-    output_file_path = os.getenv("OUTPUT_FILE")
+    from env_file_handler import check_env_file  # noqa: PLC0415
+
+    check_env_file()
+    # Parse the .env check_env_file manages (cwd-relative) once, without touching os.environ;
+    # real environment variables still take precedence
+    env_file = dotenv_values(".env")
+    input_file_path = os.environ.get("INPUT_FILE") or env_file.get("INPUT_FILE")
+    output_file_path = os.environ.get("OUTPUT_FILE") or env_file.get("OUTPUT_FILE")
 
-    if input_file_path is None or output_file_path is None:
+    # The generated .env template leaves both empty, which must not turn into Path("")
+    if not input_file_path or not output_file_path:
         raise ValueError(
             "Either provide input path via command line or set both INPUT_FILE and OUTPUT_FILE environment variables",
         )
 
-    return Path(input_file_path), Path(output_file_path)
+    return [(Path(input_file_path), Path(output_file_path))]
 
 
-def main() -> None:
-    start_time = time.time()
-    try:
-        logger.info("=== Starting Video Processing ===")
+def _abort_encoding(processor: VideoProcessor, _signum: int, _frame: FrameType | None) -> None:
+    """SIGINT handler during encoding: stop ffmpeg and delete the partial output before exiting."""
+    logger.warning("Interrupted, stopping encoder and removing partial output")
+    processor.terminate()
+    raise KeyboardInterrupt
 
-        # Create optimized configuration
-        config = EncodingConfig(
-            target_size_gb=4.0,
-            maintain_dolby_vision=True,
-            copy_audio=True,
-            copy_subtitles=True,
-            english_audio_only=True,
-            english_subtitles_only=True,
-            use_hardware_acceleration=True,
-            hardware_encoder="hevc_videotoolbox",
-            quality_preset=EncodingPresetVideotoolbox.SLOW,
-            allow_sw_fallback=True,
-            realtime="false",
-            min_video_bitrate=8_000_000,  # 8 Mbps
-            max_video_bitrate=30_000_000,  # 30 Mbps
-            b_frames="4",
-            profile_v="main10",
-            max_ref_frames="6",
-            group_of_pictures="120",
-            # extra params
-            audio_bitrate="768k",  # Specify the bitrate for the TrueHD stream
-            audio_codec="eac3",  # this is a backup if audio copy doesnt work
-            audio_channel="6",  # Set to 8 for 7.1 surround sound # TODO: make this work
-            # x265 params (only when videotoolbox doesnt work)
-            preset=EncodingPreset.VERYSLOW,
-            hdr_params={
-                "max_cll": "1600,400",
-                "master_display": "G(13250,34500)B(7500,3000)R(34000,16000)WP(15635,16450)L(10000000,50)",
-            },
-        )
 
-        # Get input and output paths
-        input_file, output_file = get_file_paths()
-
-        # Validate input file
-        if not input_file.exists():
-            raise FileNotFoundError(f"Input file does not exist: {input_file}")
-        if not os.access(input_file, os.R_OK):
-            raise PermissionError(f"Cannot read input file: {input_file}")
-        if not validate_encoding_setup(input_file, output_file, config):
-            logger.error("Validation failed. Exiting.")
-            return
-        logger.info("=== Configuration Settings ===")
-        logger.info(f"Input File: {input_file}")
-        logger.info(f"Output File: {output_file}")
-        logger.info(f"Target Size: {config.target_size_gb} GB")
-        logger.info(f"Encoding Preset: {config.preset.value}")
-        logger.info(f"Hardware Acceleration: {'Enabled' if config.use_hardware_acceleration else 'Disabled'}")
-        logger.info(f"Hardware Encoder: {config.hardware_encoder}")
-        logger.info(f"Quality Preset: {config.quality_preset}")
-        logger.info(f"Audio Settings: {config.audio_codec} @ {config.audio_bitrate}")
+def process_file(input_file: Path, output_file: Path, config: EncodingConfig) -> bool:
+    """
+    Validate, analyze, encode and verify a single input file.
+
+    Args:
+        input_file (Path): The input video file
+        output_file (Path): The output file path
+        config (EncodingConfig): The encoding configuration
+
+    Returns:
+        bool: False if validation rejected the file, True once it has been encoded and verified
+    """
+    start_time = time.time()
+
+    # Stat the input once; validation and the final stats reuse it
+    try:
+        input_stat = input_file.stat()
+    except FileNotFoundError as err:
+        raise FileNotFoundError(f"Input file does not exist: {input_file}") from err
+    if not os.access(input_file, os.R_OK):
+        raise PermissionError(f"Cannot read input file: {input_file}")
+    if not validate_encoding_setup(input_file, output_file, config, input_stat):
+        logger.error("Validation failed. Exiting.")
+        return False
+    if logger.isEnabledFor(logging.INFO):
         logger.info(
-            f"Language Filters: English Audio Only: {config.english_audio_only}, "
-            f"English Subtitles Only: {config.english_subtitles_only}",
+            "\n".join(
+                (
+                    "=== Configuration Settings ===",
+                    f"Input File: {input_file}",
+                    f"Output File: {output_file}",
+                    f"Target Size: {config.target_size_gb} GB",
+                    f"Encoding Preset: {config.preset}",
+                    f"Hardware Acceleration: {'Enabled' if config.use_hardware_acceleration else 'Disabled'}",
+                    f"Hardware Encoder: {config.hardware_encoder}",
+                    f"Quality Preset: {config.quality_preset}",
+                    f"Audio Settings: {config.audio_codec} @ {config.audio_bitrate}",
+                    (
+                        f"Language Filters: English Audio Only: {config.english_audio_only}, "
+                        f"English Subtitles Only: {config.english_subtitles_only}"
+                    ),
+                ),
+            ),
         )
 
+    # Initialize processor
+    processor = VideoProcessor(input_file, config)
+
+    # The version checks, the input probe and the encoder detection are independent subprocesses, so overlap them
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        version_futures = {tool: executor.submit(get_tool_version, tool) for tool in ["ffmpeg", "ffprobe"]}
+        probe_future = executor.submit(processor.probe_file)
+        hw_future = executor.submit(processor._check_hardware_support)
+
         # Check system capabilities
         logger.info("=== System Check ===")
-        for tool in ["ffmpeg", "ffprobe"]:
-            version = subprocess.check_output([tool, "-version"]).decode().split("\n")[0]
-            logger.info(f"{tool.upper()} Version: {version}")
-
-        # Initialize processor
-        processor = VideoProcessor(input_file, config)
+        for tool, future in version_futures.items():
+            logger.info(f"{tool.upper()} Version: {future.result()}")
 
         # Analyze input
         logger.info("=== Input Analysis ===")
-        probe_data = processor.probe_file()
-        logger.log_input_analysis(probe_data)
-
-        # Start encoding
-        target_bitrate = processor._calculate_bitrate()
-        cmd = processor._build_command(output_file, target_bitrate)
-        logger.log_encoding_start(output_file, target_bitrate, cmd)
-        logger.log_estimated_duration(processor.duration)
-        encoding_start_time = time.time()
+        probe_data = probe_future.result()
+        hw_future.result()
+    logger.log_input_analysis(probe_data)
+
+    # Start encoding
+    logger.log_encoding_start(output_file, processor.target_bitrate, processor.command(output_file))
+    logger.log_estimated_duration(processor.duration)
+    encoding_start_time = time.time()
+    previous_handler = signal.signal(signal.SIGINT, functools.partial(_abort_encoding, processor))
+    try:
         processor.encode(output_file)
-        encoding_duration = time.time() - encoding_start_time
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    encoding_duration = time.time() - encoding_start_time
 
-        # Log encoding complete
-        logger.log_encoding_complete(input_file, output_file, encoding_duration)
+    # Log encoding complete
+    logger.log_encoding_complete(input_file, output_file, encoding_duration, input_stat.st_size)
 
-        # Verify output file integrity
-        logger.log_verification(output_file)
+    # Verify output file integrity
+    logger.log_verification(output_file)
+
+    # Log final stats
+    logger.log_final_stats(start_time)
+    return True
+
+
+def process_batch(file_pairs: list[tuple[Path, Path]], config: EncodingConfig, jobs: int) -> None:
+    """
+    Encode several files with up to `jobs` ffmpeg processes running at once.
+
+    Raises:
+        EncodingError: If any of the files failed, after all of them have been attempted
+    """
+    logger.info(f"Processing {len(file_pairs)} files with {jobs} parallel job(s), {config.threads} thread(s) each")
+    failed = 0
+    # Spawned rather than forked: a forked worker inherits the log pipeline without its listener thread,
+    # so nothing it logged would ever be written. The initializer points each worker at this run's log file
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=use_log_file,
+        initargs=(logger.log_file,),
+    ) as executor:
+        futures = {
+            executor.submit(process_file, input_file, output_file, config): input_file
+            for input_file, output_file in file_pairs
+        }
+        for future in as_completed(futures):
+            try:
+                if not future.result():
+                    failed += 1
+                    logger.error(f"Failed to process {futures[future]}: validation failed")
+            except Exception as err:
+                failed += 1
+                logger.error(f"Failed to process {futures[future]}: {err!s}")
+
+    if failed:
+        raise EncodingError(f"{failed} of {len(file_pairs)} files failed to process")
+
+
+def main() -> None:
+    try:
+        logger.info("=== Starting Video Processing ===")
+
+        # Get input and output paths
+        args = parse_args()
+        config = load_config(args)
+        file_pairs = get_file_paths(args)
+        if not file_pairs:
+            raise FileNotFoundError(f"No video files found in: {args.input}")
+
+        if len(file_pairs) == 1:
+            input_file, output_file = file_pairs[0]
+            if args.threads_per_job:
+                config = dataclasses.replace(config, threads=args.threads_per_job)
+            process_file(input_file, output_file, config)
+            return
 
-        # Log final stats
-        logger.log_final_stats(start_time)
+        # Split the cores between the parallel jobs so they don't oversubscribe the machine
+        jobs = max(1, min(args.jobs or 2, len(file_pairs)))
+        threads = args.threads_per_job or max(1, (os.cpu_count() or 2) // jobs)
+        process_batch(file_pairs, dataclasses.replace(config, threads=threads), jobs)
 
     except Exception as err:
         logger.error("\n=== Processing Failed ===")
@@ -0,0 +1,14 @@
+# test/conftest.py
+import logging
+import pytest
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _quiet_logging():
+    """
+    Drop every log record for the whole run, so tests neither format and queue them nor create an
+    encoding_*.log file (the shared file handler only opens it on the first record).
+    """
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
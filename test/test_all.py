@@ -1,8 +1,27 @@
 # test/test_all.py
+import argparse
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
 import pytest
-from unittest.mock import patch
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from unittest.mock import MagicMock, call, patch
 from pathlib import Path
-from video_processor import VideoProcessor, EncodingConfig, EncodingError
+import main
+import validate
+from custom_logger import BufferedFileHandler, _wait_for_exit
+from utils import ffmpeg_encoders, find_tool
+from video_processor import (
+    VideoProcessor,
+    EncodingConfig,
+    EncodingError,
+    _parse_frame_rate,
+)
 
 
 # 1. Unit Tests
@@ -22,11 +41,20 @@ class TestVideoProcessor:
         input_file.write_bytes(b"dummy content")
         return VideoProcessor(input_file, mock_config)
 
-    def test_probe_file(self, processor):
-        with patch("subprocess.run") as mock_run:
-            mock_run.return_value.stdout = '{"format": {"size": "1000000", "duration": "60"}}'
+    def test_probe_file(self, processor, tmp_path):
+        ffprobe = MagicMock(returncode=0)
+        ffprobe.__enter__.return_value = ffprobe
+        ffprobe.stdout = io.BytesIO(b'{"format": {"size": "1000000", "duration": "60"}, "streams": []}')
+
+        with (
+            patch("video_processor.PROBE_CACHE_DIR", tmp_path / "probe"),
+            patch("video_processor.subprocess.Popen", return_value=ffprobe) as mock_popen,
+        ):
             probe_data = processor.probe_file()
             assert probe_data["format"]["duration"] == "60"
+            assert processor.probe_file() == probe_data  # Served from the on-disk cache
+
+        assert mock_popen.call_count == 1
 
     def test_calculate_bitrate(self, processor):
         processor.duration = 60
@@ -83,6 +111,29 @@ def test_invalid_input_file():
         VideoProcessor(Path("nonexistent.mp4"), EncodingConfig())
 
 
+@pytest.mark.parametrize(
+    ("create_input", "tools_installed", "expected_error", "message"),
+    [
+        (True, True, None, None),
+        (False, True, FileNotFoundError, "Invalid input file"),
+        (True, False, OSError, "ffmpeg or ffprobe not found in PATH"),
+    ],
+    ids=["valid", "missing-input", "missing-tools"],
+)
+def test_initialization(tmp_path, create_input, tools_installed, expected_error, message):
+    input_file = tmp_path / "movie.mkv"
+    if create_input:
+        input_file.write_bytes(b"dummy content")
+    side_effect = None if tools_installed else FileNotFoundError("ffmpeg not found in PATH")
+
+    with (
+        patch("video_processor.find_tool", return_value="/usr/bin/ffmpeg", side_effect=side_effect),
+        pytest.raises(expected_error, match=message) if expected_error else nullcontext(),
+    ):
+        processor = VideoProcessor(input_file)
+        assert processor.input_file == input_file
+
+
 def test_encoding_failure():
     with pytest.raises(EncodingError):
         processor = VideoProcessor(Path("test.mp4"), EncodingConfig())
@@ -136,3 +187,454 @@ def mock_ffprobe_output():
         ],
         "format": {"duration": "60.0", "size": "1073741824"},
     }
+
+
+@pytest.fixture
+def make_processor(tmp_path):
+    """Build VideoProcessors for a dummy input file, with tool lookups stubbed for the whole test."""
+    input_file = tmp_path / "movie.mkv"
+    input_file.write_bytes(b"dummy content")
+    with patch("video_processor.find_tool", return_value="/usr/bin/ffmpeg"):
+        yield lambda config=None: VideoProcessor(input_file, config)
+
+
+# 8. Logger Tests
+def test_wait_for_exit_drains_pipes():
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import sys; print('x' * 200_000); sys.stderr.write('probe error')"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stderr = _wait_for_exit(process, timeout=30)
+    assert stderr == "probe error"
+    assert process.returncode == 0
+
+
+def test_wait_for_exit_falls_back_without_pidfd():
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import sys; sys.stderr.write('probe error')"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    with patch("custom_logger.os.pidfd_open", side_effect=OSError, create=True):
+        stderr = _wait_for_exit(process, timeout=30)
+    assert stderr == "probe error"
+    assert process.returncode == 0
+
+
+def test_buffered_file_handler_keeps_records_on_write_failure(tmp_path):
+    handler = BufferedFileHandler(str(tmp_path / "test.log"), encoding="utf-8")
+    record = logging.LogRecord("test", logging.INFO, __file__, 0, "queued message", None, None)
+    handler.emit(record)
+
+    with patch("os.write", side_effect=OSError("disk full")), pytest.raises(OSError):
+        handler.flush_now()
+
+    handler.close()  # Retries the write
+    assert (tmp_path / "test.log").read_text(encoding="utf-8") == "queued message\n"
+
+
+def test_buffered_file_handler_emit_survives_write_failure(tmp_path):
+    handler = BufferedFileHandler(str(tmp_path / "test.log"), encoding="utf-8")
+    record = logging.LogRecord("test", logging.WARNING, __file__, 0, "disk trouble", None, None)
+
+    with patch("os.write", side_effect=OSError("disk full")), patch.object(handler, "handleError") as mock_error:
+        handler.emit(record)  # Must not raise, it runs on the QueueListener thread
+
+    mock_error.assert_called_once_with(record)
+    handler.close()  # Retries the write
+    assert (tmp_path / "test.log").read_text(encoding="utf-8") == "disk trouble\n"
+
+
+def test_buffered_file_handler_flushes_full_ring(tmp_path):
+    handler = BufferedFileHandler(str(tmp_path / "test.log"), encoding="utf-8")
+    handler._ring = deque(maxlen=3)
+    for i in range(4):
+        handler.emit(logging.LogRecord("test", logging.INFO, __file__, 0, f"message {i}", None, None))
+
+    # The first three were written when the ring filled, instead of message 0 being evicted by message 3
+    assert (tmp_path / "test.log").read_text(encoding="utf-8") == "message 0\nmessage 1\nmessage 2\n"
+    handler.close()
+    assert (tmp_path / "test.log").read_text(encoding="utf-8").splitlines()[-1] == "message 3"
+
+
+# 9. Entry Point Tests
+def test_get_tool_version_uses_disk_cache(tmp_path):
+    tool = tmp_path / "fakeprobe"
+    tool.write_text("#!/bin/sh\necho 'fakeprobe version 7.1'\necho 'built with cc'\n")
+    tool.chmod(0o755)
+    main._load_tool_version_cache.cache_clear()
+    find_tool.cache_clear()
+
+    with (
+        patch("main.TOOL_VERSION_CACHE", tmp_path / "cache" / "tool_versions.json"),
+        patch("shutil.which", return_value=str(tool)),
+    ):
+        assert main.get_tool_version("fakeprobe") == "fakeprobe version 7.1"
+        with patch("subprocess.Popen") as mock_popen:
+            assert main.get_tool_version("fakeprobe") == "fakeprobe version 7.1"
+            assert not mock_popen.called
+
+    main._load_tool_version_cache.cache_clear()
+    find_tool.cache_clear()
+
+
+def test_probe_file_skips_ffprobe_for_unchanged_file(make_processor, tmp_path):
+    probe_data = {"streams": [], "format": {"size": "13", "duration": "60"}}
+    ffprobe = MagicMock(returncode=0)
+    ffprobe.__enter__.return_value = ffprobe
+
+    processor = make_processor()
+    second_processor = make_processor()
+
+    with (
+        patch("video_processor.PROBE_CACHE_DIR", tmp_path / "probe"),
+        patch("video_processor.find_tool", return_value="/usr/bin/ffprobe"),
+        patch("video_processor.subprocess.Popen", return_value=ffprobe) as mock_popen,
+    ):
+        ffprobe.stdout = io.BytesIO(json.dumps(probe_data).encode())
+        assert processor.probe_file() == probe_data
+        assert second_processor.probe_file() == probe_data
+
+    assert mock_popen.call_count == 1
+
+
+def test_get_file_paths_expands_directory_input(tmp_path):
+    for name in ["b.mkv", "a.MP4", "notes.txt"]:
+        (tmp_path / name).write_bytes(b"dummy content")
+
+    pairs = main.get_file_paths(argparse.Namespace(input=str(tmp_path)))
+
+    finished = tmp_path.resolve() / "finished"
+    assert pairs == [
+        (tmp_path.resolve() / "a.MP4", finished / "a.MP4"),
+        (tmp_path.resolve() / "b.mkv", finished / "b.mkv"),
+    ]
+
+
+def test_load_config_applies_toml_and_cli_overrides(tmp_path):
+    overrides = tmp_path / "overrides.toml"
+    overrides.write_text('target_size_gb = 8.0\naudio_bitrate = "640k"\n', encoding="utf-8")
+
+    config = main.load_config(argparse.Namespace(config=str(overrides), target_size=6.0))
+
+    assert config.target_size_gb == 6.0
+    assert config.audio_bitrate == "640k"
+    assert config.b_frames == main.DEFAULT_CONFIG.b_frames
+    assert main.load_config(argparse.Namespace(config=None, target_size=None)) is not main.DEFAULT_CONFIG
+
+
+def test_process_batch_counts_rejected_files_as_failures(tmp_path):
+    pairs = [(tmp_path / "a.mkv", tmp_path / "out_a.mkv"), (tmp_path / "b.mkv", tmp_path / "out_b.mkv")]
+
+    with (
+        # Threads stand in for the spawned workers, so the patched process_file is the one that runs
+        patch("main.ProcessPoolExecutor", lambda max_workers, **_kwargs: ThreadPoolExecutor(max_workers)),
+        patch("main.process_file", side_effect=[True, False]),
+        pytest.raises(EncodingError, match="1 of 2 files failed"),
+    ):
+        main.process_batch(pairs, main.DEFAULT_CONFIG, jobs=1)
+
+
+# 10. Command Builder Tests
+def test_build_command_reuses_argv_template(make_processor, tmp_path):
+    probe_data = {
+        "streams": [
+            {"index": 0, "codec_type": "video", "codec_name": "hevc", "width": 3840, "height": 2160},
+            {"index": 1, "codec_type": "audio", "tags": {"language": "eng"}},
+        ],
+        "format": {"size": "13", "duration": "60"},
+    }
+
+    processor = make_processor(EncodingConfig(use_hardware_acceleration=False))
+    processor.load_probe_data(probe_data)
+    processor.hw_support = False
+
+    with patch.object(processor, "_get_stream_indexes", wraps=processor._get_stream_indexes) as mock_indexes:
+        first = processor._build_command(tmp_path / "out.mp4", 10_000_000)
+        second = processor._build_command(tmp_path / "out.mp4", 20_000_000)
+
+    assert mock_indexes.call_count == 1
+    assert (
+        first[:11]
+        == second[:11]
+        == [
+            "/usr/bin/ffmpeg",
+            "-y",
+            "-nostats",
+            "-progress",
+            "pipe:1",
+            "-hwaccel",
+            "videotoolbox",
+            "-i",
+            str(processor.input_file),
+            "-map",
+            "0:0",
+        ]
+    )
+    assert first[-1] == second[-1] == str(tmp_path / "out.mp4")
+    assert "bitrate=10000" in " ".join(first)
+    assert "bitrate=20000" in " ".join(second)
+
+
+def test_verify_output_skips_ffprobe_for_known_header(make_processor, tmp_path):
+    output_file = tmp_path / "out.mp4"
+    output_file.write_bytes(b"\x00\x00\x00\x20ftypisom" + bytes(24))
+    process = MagicMock(returncode=0)
+
+    processor = make_processor()
+
+    with patch("video_processor.subprocess.run") as mock_run:
+        processor._verify_output(output_file, process)
+        assert not mock_run.called
+
+        output_file.write_bytes(b"garbage" + bytes(25))
+        with patch("video_processor.find_tool", return_value="/usr/bin/ffprobe"):
+            processor._verify_output(output_file, process)
+        mock_run.assert_called_once_with(["/usr/bin/ffprobe", str(output_file)], check=True, capture_output=True)
+
+
+def test_terminate_stops_encoder_and_removes_partial_output(make_processor, tmp_path):
+    output_file = tmp_path / "out.mp4"
+    output_file.write_bytes(b"partial")
+
+    processor = make_processor()
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"], text=True)
+    processor._process = process
+    processor._output_path = output_file
+
+    processor.terminate()
+
+    assert process.returncode is not None
+    assert not output_file.exists()
+
+
+def test_terminate_keeps_finished_output(make_processor, tmp_path):
+    output_file = tmp_path / "out.mp4"
+    output_file.write_bytes(b"finished")
+
+    processor = make_processor()
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    processor._process = process
+    processor._output_path = output_file
+
+    processor.terminate()
+
+    assert output_file.exists()
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="CPU affinity is only set on Linux")
+def test_encode_isolates_encoder_and_restores_driver_affinity(make_processor, tmp_path):
+    processor = make_processor()
+    processor.probe_data = {"format": {}, "streams": []}
+
+    with (
+        patch("video_processor._AVAILABLE_CPUS", frozenset({0, 1, 2, 3})),
+        patch("video_processor.os.sched_getaffinity", return_value={0, 1, 2, 3}),
+        patch("video_processor._set_process_affinity") as mock_process_affinity,
+        patch("video_processor.subprocess.Popen", return_value=MagicMock(pid=1234)) as mock_popen,
+        patch.object(processor, "command", return_value=["ffmpeg"]),
+        patch.object(processor, "_monitor_encoding_process"),
+        patch.object(processor, "_verify_output"),
+    ):
+        processor.encode(tmp_path / "out.mp4")
+
+    assert mock_process_affinity.call_args_list == [
+        call({0}),  # Every driver thread pinned while it monitors
+        call({0, 1, 2, 3}),  # And given its cores back afterwards
+    ]
+    # The encoder's mask is applied in the child before exec, not to the running ffmpeg afterwards
+    preexec_fn = mock_popen.call_args.kwargs["preexec_fn"]
+    assert preexec_fn.func is os.sched_setaffinity
+    assert preexec_fn.args == (0, frozenset({1, 2, 3}))
+
+
+def test_ffmpeg_encoders_parses_and_caches_encoder_list(tmp_path):
+    fake_ffmpeg = tmp_path / "ffmpeg"
+    fake_ffmpeg.write_bytes(b"")
+    encoders_output = (
+        "Encoders:\n"
+        " V..... = Video\n"
+        " A..... = Audio\n"
+        " ------\n"
+        " V....D libx265              libx265 H.265 / HEVC (codec hevc)\n"
+        " V....D hevc_videotoolbox    VideoToolbox H.265 Encoder (codec hevc)\n"
+        " A....D aac                  AAC (Advanced Audio Coding)\n"
+    )
+    ffmpeg_encoders.cache_clear()
+
+    with (
+        patch("utils.ENCODERS_CACHE", tmp_path / "encoders.json"),
+        patch("utils.find_tool", return_value=str(fake_ffmpeg)),
+        patch("utils.subprocess.run", return_value=MagicMock(stdout=encoders_output)) as mock_run,
+    ):
+        assert ffmpeg_encoders() == frozenset({"libx265", "hevc_videotoolbox", "aac"})
+        ffmpeg_encoders.cache_clear()
+        assert ffmpeg_encoders() == frozenset({"libx265", "hevc_videotoolbox", "aac"})
+
+    assert mock_run.call_count == 1
+    ffmpeg_encoders.cache_clear()
+
+
+def test_hardware_encoder_check_matches_encoder_names():
+    with patch("validate.ffmpeg_encoders", return_value=frozenset({"libx265", "hevc_videotoolbox"})):
+        assert validate.is_hardware_encoder_available("hevc_videotoolbox")
+        assert not validate.is_hardware_encoder_available("hevc")  # Whole names only, not substrings of the listing
+
+    with patch("validate.ffmpeg_encoders", side_effect=FileNotFoundError):
+        assert not validate.is_hardware_encoder_available("hevc_videotoolbox")
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="/proc/meminfo is Linux only")
+def test_unreadable_meminfo_skips_the_memory_check(tmp_path):
+    with patch("validate.Path") as mock_path:
+        mock_path.return_value.open.side_effect = PermissionError
+        assert validate._available_memory() is None
+
+    with patch("validate._available_memory", return_value=None), patch("validate._warn") as mock_warn:
+        validate.validate_system_resources(tmp_path / "in.mkv", tmp_path / "out.mkv", input_size=0)
+    mock_warn.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        (b"\x1a\x45\xdf\xa3\x01\x00\x00\x00", True),  # MKV
+        (b"\x00\x00\x00\x20ftypisom", True),  # MP4
+        (b"\x00\x00\x10\x00moov\x00\x00", True),  # MOV
+        (b"RIFF\x00\x10\x00\x00AVI ", True),  # AVI
+        (b"ftyp\x00\x00\x00\x00", False),  # Box type at the wrong offset
+        (b"\x1a\x45\xdf", False),  # Too short
+    ],
+)
+def test_is_valid_video_header_checks_signatures_at_their_offsets(header, expected):
+    assert validate.is_valid_video_header(header) is expected
+
+
+def test_classify_header_names_the_container():
+    assert validate._classify_header(b"\x00\x00\x00\x20ftypisom") is validate.VideoKind.MP4
+    assert validate._classify_header(b"\x1a\x45\xdf\xa3\x01\x00\x00\x00") is validate.VideoKind.MKV
+    assert validate._classify_header(b"\x00" * 8) is None
+
+
+def test_get_stream_indexes_filters_languages_per_stream_type(make_processor):
+    probe_data = {
+        "streams": [
+            {"index": 0, "codec_type": "video"},
+            {"index": 1, "codec_type": "audio", "tags": {"language": "eng"}},
+            {"index": 2, "codec_type": "audio", "tags": {"language": "fre"}},
+            {"index": 3, "codec_type": "subtitle", "tags": {"language": "ENG"}},
+            {"index": 4, "codec_type": "subtitle", "tags": {"language": "ger"}},
+            {"index": 5, "codec_type": "attachment"},
+        ],
+        "format": {"size": "13", "duration": "60"},
+    }
+
+    processor = make_processor(EncodingConfig(english_audio_only=True, english_subtitles_only=False))
+    processor.load_probe_data(probe_data)
+
+    assert processor._get_stream_indexes() == {"video": [0], "audio": [1], "subtitle": [3, 4]}
+
+
+def test_parse_frame_rate_handles_ffprobe_rationals():
+    assert _parse_frame_rate("24000/1001") == pytest.approx(23.976, abs=1e-3)
+    assert _parse_frame_rate("25/1") == 25.0
+    assert _parse_frame_rate("30") == 30.0
+    assert _parse_frame_rate("0/0") == 0.0
+
+
+def test_monitor_encoding_process_parses_progress_pipe(make_processor):
+    script = (
+        "import sys; "
+        "sys.stdout.write('frame=10\\nfps=24.0\\nprogress=continue\\nframe=20\\nfps=24.0\\nprogress=end\\n'); "
+        "sys.stderr.write('Error while decoding\\n')"
+    )
+
+    processor = make_processor()
+    process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    with (
+        patch("video_processor.logger.log_frame") as mock_log_frame,
+        patch("video_processor.logger.error") as mock_error,
+    ):
+        processor._monitor_encoding_process(process, encoding_timeout_seconds=30)
+
+    assert mock_log_frame.call_args_list[-1].args[0] == "20"
+    mock_error.assert_called_once_with("Error while decoding")
+
+
+def test_monitor_encoding_process_detects_silent_stall(make_processor):
+    processor = make_processor()
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(30)"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    try:
+        with pytest.raises(EncodingError, match="stalled"):
+            processor._monitor_encoding_process(process, encoding_timeout_seconds=1)
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_command_is_built_once_per_output(make_processor, tmp_path):
+    processor = make_processor()
+
+    with (
+        patch.object(processor, "_calculate_bitrate", return_value=10_000_000) as mock_bitrate,
+        patch.object(processor, "_build_command", return_value=["ffmpeg"]) as mock_build,
+    ):
+        assert processor.command(tmp_path / "out.mp4") is processor.command(tmp_path / "out.mp4")
+        assert processor.target_bitrate == 10_000_000
+
+    assert mock_bitrate.call_count == 1
+    mock_build.assert_called_once_with(tmp_path / "out.mp4", 10_000_000)
+
+
+@pytest.mark.parametrize(
+    ("height", "expected_bitrate"),
+    # 1 GB over 100 s is ~81.6 Mbps before the resolution multiplier, floored to whole Mbps
+    [
+        (720, 28_000_000),
+        (1000, 28_000_000),
+        (1080, 44_000_000),
+        (2000, 61_000_000),
+        (2160, 81_000_000),
+        (4320, 81_000_000),
+    ],
+)
+def test_resolution_multiplier_covers_non_standard_heights(make_processor, height, expected_bitrate):
+    processor = make_processor(
+        EncodingConfig(
+            target_size_gb=1.0, copy_audio=False, min_video_bitrate=1_000_000, max_video_bitrate=200_000_000
+        ),
+    )
+    processor.probe_data = {"format": {"duration": "100"}, "streams": []}
+    processor.duration = 100
+    processor.video_metadata = {
+        "height": height,
+        "has_dovi": False,
+        "is_hdr10": False,
+        "is_hlg": False,
+        "frame_rate": 24,
+        "bits_per_raw_sample": 8,
+        "codec_name": "h264",
+    }
+
+    assert processor._calculate_bitrate() == expected_bitrate
+
+
+def test_get_file_paths_rejects_empty_env_template(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("INPUT_FILE", raising=False)
+    monkeypatch.delenv("OUTPUT_FILE", raising=False)
+    (tmp_path / ".env").write_text("INPUT_FILE=\nOUTPUT_FILE=\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="INPUT_FILE and OUTPUT_FILE"):
+        main.get_file_paths(argparse.Namespace(input=None))
+
+    (tmp_path / ".env").write_text("INPUT_FILE=in.mkv\nOUTPUT_FILE=out.mp4\n", encoding="utf-8")
+    assert main.get_file_paths(argparse.Namespace(input=None)) == [(Path("in.mkv"), Path("out.mp4"))]
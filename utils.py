@@ -1,7 +1,17 @@
 # utils.py
-from enum import Enum
+import functools
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import suppress
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields
+from enum import Enum, StrEnum
+from pathlib import Path
+from types import MappingProxyType
 from typing import Any, TypedDict
-from pydantic import BaseModel, Field
 
 
 class EncoderError(Exception):
@@ -16,7 +26,70 @@ class EncodingError(EncoderError):
     pass
 
 
-class EncodingPreset(str, Enum):
+@functools.lru_cache(maxsize=8)
+def find_tool(name: str) -> str:
+    """
+    Resolve an executable in PATH once per process.
+
+    Raises:
+        FileNotFoundError: If the tool is not in PATH
+    """
+    tool_path = shutil.which(name)
+    if tool_path is None:
+        raise FileNotFoundError(f"{name} not found in PATH")
+    return tool_path
+
+
+# Encoder names per ffmpeg binary, re-listed only when the binary's mtime changes
+ENCODERS_CACHE = Path.home() / ".cache" / "bd-remux" / "encoders.json"
+
+# `ffmpeg -encoders` rows are a six character capability column (e.g. "V....D") followed by the encoder name
+ENCODER_FLAGS_WIDTH = 6
+ENCODER_MIN_COLUMNS = 2
+
+
+@functools.lru_cache(maxsize=1)
+def ffmpeg_encoders() -> frozenset[str]:
+    """
+    Names of the encoders the ffmpeg in PATH supports, listed once per process and cached on disk.
+
+    Raises:
+        FileNotFoundError: If ffmpeg is not in PATH
+    """
+    ffmpeg = find_tool("ffmpeg")
+    key = {"path": ffmpeg, "mtime_ns": Path(ffmpeg).stat().st_mtime_ns}
+    with suppress(OSError, ValueError, KeyError):
+        cached = json.loads(ENCODERS_CACHE.read_text(encoding="utf-8"))
+        if cached["key"] == key:
+            return frozenset(cached["encoders"])
+
+    output = subprocess.run([ffmpeg, "-hide_banner", "-encoders"], capture_output=True, text=True, check=False).stdout
+    # Encoder lines look like " V....D hevc_videotoolbox  VideoToolbox H.265 Encoder", the legend above has "=" second
+    encoders = frozenset(
+        parts[1]
+        for line in output.splitlines()
+        if len(parts := line.split()) >= ENCODER_MIN_COLUMNS
+        and len(parts[0]) == ENCODER_FLAGS_WIDTH
+        and parts[0][0] in "VAS"
+        and parts[1] != "="
+    )
+    if encoders:
+        with suppress(OSError):  # The cache is only an optimization, never fail the run over it
+            ENCODERS_CACHE.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file and rename so concurrent runs never see a partially written cache
+            with tempfile.NamedTemporaryFile(
+                "w",
+                dir=ENCODERS_CACHE.parent,
+                suffix=".tmp",
+                delete=False,
+                encoding="utf-8",
+            ) as f:
+                json.dump({"key": key, "encoders": sorted(encoders)}, f)
+            Path(f.name).replace(ENCODERS_CACHE)
+    return encoders
+
+
+class EncodingPreset(StrEnum):
     ULTRAFAST = "ultrafast"
     SUPERFAST = "superfast"
     VERYFAST = "veryfast"
@@ -28,7 +101,7 @@ class EncodingPreset(str, Enum):
     VERYSLOW = "veryslow"
 
 
-class EncodingPresetVideotoolbox(str, Enum):
+class EncodingPresetVideotoolbox(StrEnum):
     LOW = "low"
     MEDIUM = "medium"
     SLOW = "slow"
@@ -75,36 +148,55 @@ class HDRParams(TypedDict):
     master_display: str
 
 
-class EncodingConfig(BaseModel):
-    target_size_gb: float = Field(default=25.0)
-    preset: EncodingPreset = Field(default=EncodingPreset.MEDIUM)
-    maintain_dolby_vision: bool = Field(default=True)
-    copy_audio: bool = Field(default=True)
-    copy_subtitles: bool = Field(default=True)
-    english_audio_only: bool = Field(default=False)
-    english_subtitles_only: bool = Field(default=False)
-    use_hardware_acceleration: bool = Field(default=True)
-    hardware_encoder: str = Field(default="hevc_videotoolbox")
-    fallback_encoder: str = Field(default="libx265")
-    quality_preset: EncodingPresetVideotoolbox = Field(default=EncodingPresetVideotoolbox.MEDIUM)
-    allow_sw_fallback: bool = Field(default=True)
-    audio_codec: str = Field(default="aac")
-    audio_bitrate: str = Field(default="384k")
-    audio_channel: str = Field(default="4")
-    min_video_bitrate: int = Field(default=8_000_000)  # 8 Mbps
-    max_video_bitrate: int = Field(default=30_000_000)  # 30 Mbps
-    hdr_params: dict[str, str] = Field(
-        default_factory=lambda: {
-            "max_cll": "1000,400",
-            "master_display": "G(13250,34500)B(7500,3000)R(34000,16000)WP(15635,16450)L(10000000,50)",
-        },
-    )
-    realtime: str = Field(default="false")
-    b_frames: str = Field(default="6")
-    pix_fmt: str = Field(default="p010le")
-    profile_v: str = Field(default="main10")
-    max_ref_frames: str = Field(default="4")
-    group_of_pictures: str = Field(default="140")
-
-    class Config:
-        arbitrary_types_allowed = True
+DEFAULT_HDR_PARAMS: Mapping[str, str] = MappingProxyType(
+    {
+        "max_cll": "1000,400",
+        "master_display": "G(13250,34500)B(7500,3000)R(34000,16000)WP(15635,16450)L(10000000,50)",
+    },
+)
+
+
+@dataclass(frozen=True, slots=True)
+class EncodingConfig:
+    target_size_gb: float = 25.0
+    preset: EncodingPreset = EncodingPreset.MEDIUM
+    maintain_dolby_vision: bool = True
+    copy_audio: bool = True
+    copy_subtitles: bool = True
+    english_audio_only: bool = False
+    english_subtitles_only: bool = False
+    use_hardware_acceleration: bool = True
+    hardware_encoder: str = "hevc_videotoolbox"
+    fallback_encoder: str = "libx265"
+    quality_preset: EncodingPresetVideotoolbox = EncodingPresetVideotoolbox.MEDIUM
+    allow_sw_fallback: bool = True
+    audio_codec: str = "aac"
+    audio_bitrate: str = "384k"
+    audio_channel: str = "4"
+    min_video_bitrate: int = 8_000_000  # 8 Mbps
+    max_video_bitrate: int = 30_000_000  # 30 Mbps
+    # Shared and read-only; left out of the hash since a mapping isn't hashable (still compared for equality)
+    hdr_params: Mapping[str, str] = field(default_factory=lambda: DEFAULT_HDR_PARAMS, hash=False)
+    realtime: str = "false"
+    b_frames: str = "6"
+    pix_fmt: str = "p010le"
+    profile_v: str = "main10"
+    max_ref_frames: str = "4"
+    group_of_pictures: str = "140"
+    # Worker threads for the software (x265) fallback, half the cores so the host isn't oversubscribed
+    threads: int = field(default_factory=lambda: max(1, (os.cpu_count() or 2) // 2))
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.hdr_params, MappingProxyType):  # Keep the frozen config read-only all the way down
+            object.__setattr__(self, "hdr_params", MappingProxyType(dict(self.hdr_params)))
+        # Presets may arrive as plain strings (e.g. from a --config TOML file)
+        object.__setattr__(self, "preset", EncodingPreset(self.preset))
+        object.__setattr__(self, "quality_preset", EncodingPresetVideotoolbox(self.quality_preset))
+        if self.target_size_gb <= 0:
+            raise ValueError(f"target_size_gb must be positive, got {self.target_size_gb}")
+
+    def __reduce__(self) -> tuple[Any, tuple[()]]:
+        # mappingproxy can't be pickled, so hand hdr_params over as a dict (configs are sent to batch workers)
+        values = {f.name: getattr(self, f.name) for f in fields(self)}
+        values["hdr_params"] = dict(self.hdr_params)
+        return functools.partial(EncodingConfig, **values), ()
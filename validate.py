@@ -1,14 +1,20 @@
 # validate.py
+import functools
 from pathlib import Path
-import shutil
-import psutil  # type: ignore
-import subprocess
 from custom_logger import CustomLogger as Logger
-from utils import EncodingConfig
+from utils import EncodingConfig, ffmpeg_encoders
 import os
+import stat
+import sys
+import time
+from contextlib import suppress
+from enum import StrEnum
 
 
 logger = Logger(__name__)
+# Bound once so the error paths don't repeat the attribute lookups
+_warn = logger.warning
+_err = logger.error
 
 # Constants
 MIN_REQUIRED_MEMORY = 4 * 1024 * 1024 * 1024  # 4 GB
@@ -16,168 +22,258 @@ MIN_BITRATE = 1_000_000  # 1 Mbps
 MAX_BITRATE = 30_000_000  # 30 Mbps
 MIN_VALID_SIZE = 100 * 1024 * 1024  # 100 MB
 MIN_HEADER_LENGTH = 8  # Minimum length required for most video file signatures
+OUTPUT_SPACE_MARGIN = 1.1  # Free space required on top of the target output size
+VIDEO_EXTENSIONS = frozenset({".mkv", ".mp4", ".avi", ".mov"})
+_VIDEO_EXTENSIONS_TEXT = ", ".join(sorted(VIDEO_EXTENSIONS))  # For the invalid file type message
+
+
+class VideoKind(StrEnum):
+    MKV = "mkv"
+    MP4 = "mp4"
+    MOV = "mov"
+    AVI = "avi"
+
+
+# Video file signatures as (offset, magic, kind); ISO-BMFF box types sit at offset 4, after the box size
+VIDEO_SIGNATURES: tuple[tuple[int, bytes, VideoKind], ...] = (
+    (0, b"\x1a\x45\xdf\xa3", VideoKind.MKV),
+    (4, b"ftyp", VideoKind.MP4),
+    (4, b"moov", VideoKind.MOV),
+    (0, b"RIFF", VideoKind.AVI),
+)
+
+# VIDEO_SIGNATURES grouped by (offset, length), so each header position costs one slice and one dict lookup
+_SIGNATURE_LOOKUP: dict[tuple[int, int], dict[bytes, VideoKind]] = {
+    (offset, len(signature)): {
+        other: kind
+        for other_offset, other, kind in VIDEO_SIGNATURES
+        if (other_offset, len(other)) == (offset, len(signature))
+    }
+    for offset, signature, _ in VIDEO_SIGNATURES
+}
 
+# Bytes read from an input file: just enough to cover every signature above
+VIDEO_HEADER_SIZE = max(MIN_HEADER_LENGTH, *(offset + len(signature) for offset, signature, _ in VIDEO_SIGNATURES))
 
-def log_warning(message: str) -> None:
-    logger.warning(message)
-
+# Range-checked configuration fields as (field, type, min, max); add a row here to validate a new field
+CONFIG_RULES: tuple[tuple[str, type[int], int, int], ...] = (("min_video_bitrate", int, MIN_BITRATE, MAX_BITRATE),)
 
-def log_error(message: str) -> None:
-    logger.error(message)
+# Free space per output directory as (monotonic time, bytes); batch runs check the same directory for every file
+FREE_SPACE_TTL = 5.0
+_free_space_cache: dict[str, tuple[float, int]] = {}
 
 
-def log_error_and_return_false(message: str) -> bool:
-    logger.error(message)
+def _err_false(message: str) -> bool:
+    """Log an error and return False, for validators that report failure through their return value."""
+    _err(message)
     return False
 
 
 def is_hardware_encoder_available(encoder_name: str) -> bool:
     """Check if the hardware encoder is available."""
     try:
-        output = subprocess.check_output(["ffmpeg", "-encoders"], stderr=subprocess.STDOUT).decode("utf-8")
-        if encoder_name not in output:
-            return log_error_and_return_false(f"Encoder {encoder_name} not found in ffmpeg output.")
+        # Listed once per process (and cached on disk), shared with VideoProcessor's hardware check
+        if encoder_name not in ffmpeg_encoders():
+            return _err_false(f"Encoder {encoder_name} not found in ffmpeg output.")
         return True
     except FileNotFoundError:
-        return log_error_and_return_false("ffmpeg not found. Ensure it is installed and available in the PATH.")
-    except subprocess.CalledProcessError as e:
-        return log_error_and_return_false(f"Error executing ffmpeg: {e.output.decode('utf-8')}")
+        return _err_false("ffmpeg not found. Ensure it is installed and available in the PATH.")
     except Exception as e:
-        return log_error_and_return_false(f"Unexpected error while checking hardware encoder: {e}")
+        return _err_false(f"Unexpected error while checking hardware encoder: {e}")
+
+
+@functools.lru_cache(maxsize=256)
+def _classify_header(header: bytes) -> VideoKind | None:
+    """Container a header belongs to, or None if no signature matches; pure, so repeat validations hit the cache."""
+    for (offset, length), kinds in _SIGNATURE_LOOKUP.items():
+        if (kind := kinds.get(header[offset : offset + length])) is not None:
+            return kind
+    return None
 
 
 def is_valid_video_header(header: bytes) -> bool:
     """Check if the file header is a valid video header."""
-    # Common video file signatures
-    signatures = {
-        "mkv": b"\x1a\x45\xdf\xa3",
-        "mp4": b"ftyp",
-        "avi": b"RIFF",
-        "mov": b"moov",
-    }
-
     if len(header) < MIN_HEADER_LENGTH:  # Need at least MIN_HEADER_LENGTH bytes for most signatures
-        return log_error_and_return_false("File header is too short to determine validity.")
+        return _err_false("File header is too short to determine validity.")
 
-    # Check for MKV signature at start
-    if header.startswith(signatures["mkv"]):
+    if _classify_header(bytes(header[:VIDEO_HEADER_SIZE])) is not None:
         return True
 
-    # Check for MP4/MOV signatures (they can appear slightly offset)
-    if any(sig in header[:MIN_HEADER_LENGTH] for sig in [signatures["mp4"], signatures["mov"]]):
-        return True
+    return _err_false("File header does not match any known video format signatures.")
+
+
+def _available_memory() -> int | None:
+    """Memory available to new processes, in bytes, or None when it cannot be determined."""
+    if sys.platform == "linux":
+        # psutil is not installed on Linux, so an unreadable /proc/meminfo means the check is skipped
+        with suppress(OSError, ValueError, IndexError), Path("/proc/meminfo").open("rb") as f:
+            for line in f:
+                if line.startswith(b"MemAvailable:"):
+                    return int(line.split()[1]) * 1024  # Reported in kB
+        _warn("Could not read MemAvailable from /proc/meminfo, skipping the memory check.")
+        return None
+    # macOS (the main target) has no sysconf counter for available memory, so psutil stays for the other platforms
+    import psutil  # type: ignore  # noqa: PLC0415
+
+    return int(psutil.virtual_memory().available)
 
-    # Check for AVI signature
-    if header.startswith(signatures["avi"]):
-        return True
 
-    return log_error_and_return_false("File header does not match any known video format signatures.")
+def _free_space(directory: Path) -> int:
+    """Free bytes for unprivileged users on the directory's filesystem, reused for FREE_SPACE_TTL seconds."""
+    now = time.monotonic()
+    cached = _free_space_cache.get(str(directory))
+    if cached is not None and now - cached[0] < FREE_SPACE_TTL:
+        return cached[1]
+    st = os.statvfs(directory)
+    free_space = st.f_bavail * st.f_frsize
+    _free_space_cache[str(directory)] = (now, free_space)
+    return free_space
 
 
-def validate_system_resources(input_file: Path, output_file: Path) -> None:
-    """Validate system resources before encoding."""
+def validate_system_resources(input_file: Path, output_file: Path, input_size: int | None = None) -> None:
+    """Validate system resources before encoding; pass input_size when the input was already stat'ed."""
     try:
         # Get the parent directory of the output file for disk space check
         output_dir = output_file.parent
-        file_size = input_file.stat().st_size
-        free_space = shutil.disk_usage(output_dir).free
-        available_memory = psutil.virtual_memory().available
+        file_size = input_file.stat().st_size if input_size is None else input_size
+        free_space = _free_space(output_dir)
+        available_memory = _available_memory()
 
         if free_space <= file_size * 2:
-            log_warning(
+            _warn(
                 "Insufficient disk space for processing. Recommended: at least double the input file size.",
             )
 
-        if available_memory <= MIN_REQUIRED_MEMORY:
-            log_warning(
+        if available_memory is not None and available_memory <= MIN_REQUIRED_MEMORY:
+            _warn(
                 f"Low memory available. Recommended: {MIN_REQUIRED_MEMORY / (1024**3)} GB or more. "
                 "Processing may be slow or unstable.",
             )
 
     except (FileNotFoundError, PermissionError) as e:
-        log_error(f"Directory error: {e}")
+        _err(f"Directory error: {e}")
     except Exception as e:
-        log_error(f"Unexpected error during resource validation: {e}")
+        _err(f"Unexpected error during resource validation: {e}")
 
 
-def validate_config(config: EncodingConfig) -> bool:
-    """Validate the encoding configuration."""
+def validate_output_space(output_file: Path, config: EncodingConfig) -> bool:
+    """Fail fast when the output directory can't hold the target size, rather than hours into the encode."""
     try:
-        if not is_hardware_encoder_available(config.hardware_encoder):
-            logger.warning("Hardware encoder not available, falling back to software encoding.")
-            config.use_hardware_acceleration = False
-
-        if not MIN_BITRATE <= config.min_video_bitrate <= MAX_BITRATE:
-            raise ValueError(
-                f"Invalid bitrate: {config.min_video_bitrate}. Must be between {MIN_BITRATE} and {MAX_BITRATE}.",
+        free_space = _free_space(output_file.parent)
+        required_space = int(config.target_size_gb * OUTPUT_SPACE_MARGIN * 1024**3)
+        if free_space < required_space:
+            return _err_false(
+                f"Insufficient disk space in {output_file.parent}: {free_space / (1024**3):.2f} GB free, "
+                f"{required_space / (1024**3):.2f} GB required for a {config.target_size_gb} GB target.",
             )
+        return True
+    except OSError as e:
+        return _err_false(f"Error checking free disk space: {e}")
+
+
+def _validate_config_cheap(config: EncodingConfig) -> bool:
+    """Checks on the configuration values alone, run before anything touches the filesystem."""
+    try:
+        for name, expected_type, low, high in CONFIG_RULES:
+            value = getattr(config, name)
+            if not isinstance(value, expected_type) or not low <= value <= high:
+                raise ValueError(f"Invalid {name}: {value}. Must be between {low} and {high}.")
 
         return True
     except (AttributeError, ValueError) as e:
-        return log_error_and_return_false(f"Configuration validation error: {e}")
+        return _err_false(f"Configuration validation error: {e}")
+    except Exception as e:
+        return _err_false(f"Unexpected error during configuration validation: {e}")
+
+
+@functools.lru_cache(maxsize=8)
+def _validate_config_expensive(config: EncodingConfig) -> bool:
+    """Checks that need ffmpeg, run last; cached per config since batch runs validate the same one for every file."""
+    try:
+        if not is_hardware_encoder_available(config.hardware_encoder):
+            # VideoProcessor only uses the hardware encoder when ffmpeg lists it, so it falls back on its own
+            _warn("Hardware encoder not available, falling back to software encoding.")
+
+        return True
     except Exception as e:
-        return log_error_and_return_false(f"Unexpected error during configuration validation: {e}")
+        return _err_false(f"Unexpected error during configuration validation: {e}")
 
 
-def validate_input_file(file_path: Path) -> bool:
-    """Validate the input video file."""
-    valid_extensions = [".mkv", ".mp4", ".avi", ".mov"]
+def validate_config(config: EncodingConfig) -> bool:
+    """Validate the encoding configuration."""
+    return _validate_config_cheap(config) and _validate_config_expensive(config)
+
 
+def validate_input_file(file_path: Path, file_stat: os.stat_result | None = None) -> bool:
+    """Validate the input video file; file_stat, when given, is reused instead of stat'ing the file again."""
     try:
-        if not file_path.exists():
-            return log_error_and_return_false(f"Input file does not exist: {file_path}")
+        if file_stat is None:
+            try:
+                file_stat = file_path.stat()
+            except FileNotFoundError:
+                return _err_false(f"Input file does not exist: {file_path}")
 
-        if not file_path.is_file():
-            return log_error_and_return_false(f"Path is not a file: {file_path}")
+        if not stat.S_ISREG(file_stat.st_mode):
+            return _err_false(f"Path is not a file: {file_path}")
 
-        if file_path.suffix.lower() not in valid_extensions:
-            return log_error_and_return_false(
-                f"Invalid file type: {file_path}. Supported extensions: {', '.join(valid_extensions)}",
+        if file_path.suffix.lower() not in VIDEO_EXTENSIONS:
+            return _err_false(
+                f"Invalid file type: {file_path}. Supported extensions: {_VIDEO_EXTENSIONS_TEXT}",
             )
 
-        if file_path.stat().st_size < MIN_VALID_SIZE:
-            return log_error_and_return_false(f"File too small to be a valid video: {file_path}")
+        if file_stat.st_size < MIN_VALID_SIZE:
+            return _err_false(f"File too small to be a valid video: {file_path}")
 
         try:
             with file_path.open("rb") as f:
-                header = f.read(4096)
+                header = f.read(VIDEO_HEADER_SIZE)
                 if not is_valid_video_header(header):
-                    return log_error_and_return_false(f"Invalid video header in file: {file_path}")
+                    return _err_false(f"Invalid video header in file: {file_path}")
         except PermissionError:
-            return log_error_and_return_false(f"Permission denied: Cannot read file {file_path}")
+            return _err_false(f"Permission denied: Cannot read file {file_path}")
 
         return True
     except Exception as e:
-        return log_error_and_return_false(f"Unexpected error validating input file: {e}")
+        return _err_false(f"Unexpected error validating input file: {e}")
 
 
 def validate_output_path(output_path: Path) -> bool:
     """Validate the output file path."""
     try:
-        # Check if parent directory exists or can be created
+        # Create the parent directory if needed; exist_ok makes this a no-op when it is already there
         output_dir = output_path.parent
-        if not output_dir.exists():
-            try:
-                output_dir.mkdir(parents=True, exist_ok=True)
-            except PermissionError:
-                return log_error_and_return_false(f"Permission denied: Cannot create output directory {output_dir}")
-            except Exception as e:
-                return log_error_and_return_false(f"Error creating output directory: {e}")
+        try:
+            output_dir.mkdir(parents=True, exist_ok=True)
+        except PermissionError:
+            return _err_false(f"Permission denied: Cannot create output directory {output_dir}")
+        except Exception as e:
+            return _err_false(f"Error creating output directory: {e}")
 
-        # Check if we can write to the directory
-        if not os.access(output_dir, os.W_OK):
-            return log_error_and_return_false(f"Permission denied: Cannot write to output directory {output_dir}")
+        # Check if we can write to the directory by trying it; os.access can be wrong on NFS and ACL-managed mounts
+        write_probe = output_dir / f".write_test_{os.getpid()}"
+        try:
+            write_probe.touch()
+            write_probe.unlink()
+        except PermissionError:
+            return _err_false(f"Permission denied: Cannot write to output directory {output_dir}")
+        except OSError as e:
+            return _err_false(f"Cannot write to output directory {output_dir}: {e}")
 
         # Check if output file already exists
         if output_path.exists():
-            log_warning(f"Output file already exists: {output_path}")
+            _warn(f"Output file already exists: {output_path}")
 
         return True
     except Exception as e:
-        return log_error_and_return_false(f"Unexpected error validating output path: {e}")
+        return _err_false(f"Unexpected error validating output path: {e}")
 
 
-def validate_encoding_setup(input_file: Path, output_file: Path, config: EncodingConfig) -> bool:
+def validate_encoding_setup(
+    input_file: Path,
+    output_file: Path,
+    config: EncodingConfig,
+    input_stat: os.stat_result | None = None,
+) -> bool:
     """
     Validate the complete encoding setup including input file, output path, system resources,
     and encoding configuration.
@@ -186,6 +282,7 @@ def validate_encoding_setup(input_file: Path, output_file: Path, config: Encodin
         input_file (Path): The input video file path
         output_file (Path): The output file path
         config (EncodingConfig): The encoding configuration
+        input_stat (os.stat_result | None): The input's stat result if the caller already has one
 
     Returns:
         bool: True if all validations pass, False otherwise
@@ -193,23 +290,36 @@ def validate_encoding_setup(input_file: Path, output_file: Path, config: Encodin
     try:
         logger.info("Starting validation checks...")
 
-        # Validate input file
-        if not validate_input_file(input_file):
+        # Cheapest checks first, so a bad setup fails before any filesystem or ffmpeg work
+        if not _validate_config_cheap(config):
             return False
 
         # Validate output path
         if not validate_output_path(output_file):
             return False
 
+        # Stat the input once; the result is shared by the input and resource checks
+        if input_stat is None:
+            with suppress(OSError):  # validate_input_file reports the failure
+                input_stat = input_file.stat()
+
+        # Validate input file
+        if not validate_input_file(input_file, input_stat):
+            return False
+
+        # Validate free space for the output
+        if not validate_output_space(output_file, config):
+            return False
+
         # Validate system resources
-        validate_system_resources(input_file, output_file)
+        validate_system_resources(input_file, output_file, input_stat.st_size if input_stat else None)
 
-        # Validate encoding configuration
-        if not validate_config(config):
+        # Validate the configuration against ffmpeg
+        if not _validate_config_expensive(config):
             return False
 
         logger.info("All validation checks passed successfully.")
         return True
 
     except Exception as e:
-        return log_error_and_return_false(f"Unexpected error during validation: {e}")
+        return _err_false(f"Unexpected error during validation: {e}")
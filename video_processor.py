@@ -1,21 +1,88 @@
 # video_processor.py
+import bisect
+import fcntl
+import functools
+import selectors
 import subprocess
+import hashlib
 import json
-import shutil
+import os
 import re
+import signal
+import sys
+import tempfile
 import time
+from collections.abc import Iterable
+from contextlib import suppress
 from pathlib import Path
 from subprocess import Popen
 from typing import Optional, Union, cast
 
 from custom_logger import CustomLogger as Logger
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from utils import ProbeError, ProbeData, EncodingConfig, EncodingError, StreamDict
+from utils import ProbeError, ProbeData, EncodingConfig, EncodingError, StreamDict, ffmpeg_encoders, find_tool
 from ffmpeg_configs import dolby_vision_metadata, hevc_metadata
 
 # Create a custom logger
 logger = Logger(__name__)
 
+# CPUs this process may use, captured before the driver pins itself so retries still hand ffmpeg the full set
+_AVAILABLE_CPUS: frozenset[int] = frozenset(os.sched_getaffinity(0)) if sys.platform == "linux" else frozenset()
+# Below this many CPUs, giving the driver a core of its own would cost the encoder too large a share
+MIN_CPUS_FOR_ISOLATION = 3
+
+# Language tags accepted by the english_audio_only / english_subtitles_only filters
+ENGLISH_LANGUAGES = frozenset({"eng", "english"})
+
+# Bitrate multiplier by frame height: below 1080p, 1080p and up, 1440p and up, 2160p and up
+RESOLUTION_HEIGHTS = (1080, 1440, 2160)
+RESOLUTION_MULTIPLIERS = (0.35, 0.55, 0.75, 1.0)
+
+# Fixed runs of FFmpeg arguments, spliced into commands instead of rebuilt per call
+_INPUT_OPTIONS = ("-y", "-nostats", "-progress", "pipe:1", "-hwaccel", "videotoolbox", "-i")
+_COPY_SUBTITLES = ("-c:s", "copy")
+_SOFTWARE_OUTPUT_FORMAT = ("-profile:v", "main10", "-pix_fmt", "yuv420p10le")
+_PROBE_OPTIONS = (
+    "-v",
+    "quiet",
+    "-print_format",
+    "json",
+    "-show_format",
+    "-show_streams",
+    "-show_frames",
+    "-read_intervals",
+    "%+#1",  # Read first frame for detailed metadata
+)
+
+# ffmpeg writes key=value progress to stdout (-progress pipe:1) and its log to stderr; both are read in binary chunks
+PIPE_CHUNK_SIZE = 64 * 1024
+PIPE_SIZE = 1 << 20  # Linux only, via F_SETPIPE_SZ
+_LINE_END_RE = re.compile(rb"[\r\n]")
+_ERROR_RE = re.compile(rb"error", re.IGNORECASE)
+
+# Parsed ffprobe output per input, reused while the file's size and mtime are unchanged
+PROBE_CACHE_DIR = Path.home() / ".cache" / "bd-remux" / "probe"
+
+# Container magic checked after encoding; ffprobe is only run when neither matches
+_MP4_FTYP = b"ftyp"  # At offset 4, after the box size
+_MKV_EBML = b"\x1a\x45\xdf\xa3"
+
+
+def _set_process_affinity(cpus: Iterable[int]) -> None:
+    """Set the CPU affinity of every thread in this process; sched_setaffinity(0, ...) only covers the caller."""
+    for task in Path("/proc/self/task").iterdir():
+        with suppress(ProcessLookupError):  # The thread exited in the meantime
+            os.sched_setaffinity(int(task.name), cpus)
+
+
+@functools.lru_cache(maxsize=32)
+def _parse_frame_rate(rate: str) -> float:
+    """Parse an ffprobe rational like "24000/1001" (or a plain number) without eval; "0/0" yields 0.0."""
+    numerator, _, denominator = rate.partition("/")
+    if denominator and float(denominator):
+        return float(numerator) / float(denominator)
+    return float(numerator)
+
 
 class VideoProcessor:
     """
@@ -40,10 +107,14 @@ class VideoProcessor:
         """
         self.input_file = Path(input_file)
         self.config = config or EncodingConfig()
-        if not self.input_file.exists() or not self.input_file.is_file():
+        if not self.input_file.is_file():  # False for missing paths too, one stat covers both checks
             raise FileNotFoundError(f"Invalid input file: {self.input_file}")
-        if not all(shutil.which(tool) for tool in ["ffmpeg", "ffprobe"]):
-            raise OSError("ffmpeg or ffprobe not found in PATH")
+        try:
+            # Resolved once per process; every later subprocess call reuses the absolute paths
+            for tool in ["ffmpeg", "ffprobe"]:
+                find_tool(tool)
+        except FileNotFoundError as e:
+            raise OSError("ffmpeg or ffprobe not found in PATH") from e
         self.probe_data: Optional[ProbeData] = None
         self.input_size_gb: float = 0.0
         self.duration: float = 0.0
@@ -53,6 +124,18 @@ class VideoProcessor:
         self.dv_bl_present_flag: Optional[int] = None
         self.dv_el_present_flag: Optional[int] = None
         self.dv_bl_signal_compatibility_id: Optional[int] = None
+        # Bitrate-independent argv (input/maps, then codec copy settings + metadata), keyed by use_hw
+        # Streams by type, filled in one pass by load_probe_data
+        self.video_stream: Optional[StreamDict] = None
+        self.audio_streams: list[StreamDict] = []
+        self.subtitle_streams: list[StreamDict] = []
+        self._argv_template: dict[bool, tuple[tuple[str, ...], tuple[str, ...]]] = {}
+        # Derived once and shared by main's logging and encode()
+        self._target_bitrate: Optional[int] = None
+        self._commands: dict[Path, list[str]] = {}
+        # Running ffmpeg child and its output, so terminate() can stop it and clean up
+        self._process: Optional[Popen[bytes]] = None
+        self._output_path: Optional[Path] = None
 
     @retry(
         retry=retry_if_exception_type((subprocess.CalledProcessError, json.JSONDecodeError)),
@@ -64,79 +147,124 @@ class VideoProcessor:
         """
         Probes the input file using ffprobe and returns the probe data.
         Detects HDR, Dolby Vision, and advanced video metadata.
+        The result is cached on disk and reused while the input's size and mtime are unchanged.
 
         Returns:
             ProbeData: The probe data of the input file.
         Raises:
             ProbeError: If the probe fails.
         """
-        try:
-            cmd = [
-                "ffprobe",
-                "-v",
-                "quiet",
-                "-print_format",
-                "json",
-                "-show_format",
-                "-show_streams",
-                "-show_frames",
-                "-read_intervals",
-                "%+#1",  # Read first frame for detailed metadata
-                str(self.input_file),
-            ]
-
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            probe_data = json.loads(result.stdout)
-
-            # Ensure the loaded data matches our expected type
-            self.probe_data = cast(ProbeData, probe_data)
-            format_info = self.probe_data["format"]
-
-            # Basic file info
-            self.input_size_gb = float(format_info["size"]) / (1024**3)
-            self.duration = float(format_info["duration"])
-
-            # Get video stream
-            video_stream = next((s for s in self.probe_data["streams"] if s["codec_type"] == "video"), None)
-            if video_stream:
-                # Detect HDR/DoVi features
-                self.video_metadata = {
-                    "codec_name": video_stream.get("codec_name", ""),
-                    "height": int(video_stream.get("height", 0)),
-                    "width": int(video_stream.get("width", 0)),
-                    "frame_rate": eval(str(video_stream.get("r_frame_rate", "24/1"))),
-                    "is_hdr10": video_stream.get("color_transfer") == "smpte2084",
-                    "is_hlg": video_stream.get("color_transfer") == "arib-std-b67",
-                    "has_dovi": any("dovi_configuration_record" in str(s) for s in self.probe_data["streams"]),
-                    "color_space": video_stream.get("color_space", ""),
-                    "color_transfer": video_stream.get("color_transfer", ""),
-                    "color_primaries": video_stream.get("color_primaries", ""),
-                    "bits_per_raw_sample": int(video_stream.get("bits_per_raw_sample", 8)),  # type: ignore
-                    "profile": video_stream.get("profile", ""),
-                }
-
-                # Detect DoVi profile if present
-                if self.video_metadata["has_dovi"]:
-                    side_data = video_stream.get("side_data_list", [])
-                    for data in side_data:  # type: ignore
-                        if "dovi_configuration_record" in str(data):
-                            self.video_metadata["dovi_profile"] = data.get("dovi_profile", 0)
-                            self.video_metadata["dovi_bl_present_flag"] = data.get("dovi_bl_present_flag", 1)
-                            self.video_metadata["dovi_el_present_flag"] = data.get("dovi_el_present_flag", 0)
-                            break
-
-                logger.info(f"Input: {self.input_size_gb:.2f}GB, Duration: {self.duration:.2f}s")
-                logger.info(
-                    f"Video: {self.video_metadata['width']}x{self.video_metadata['height']}, "
-                    f"{'HDR10' if self.video_metadata['is_hdr10'] else ''}"
-                    f"{'Dolby Vision' if self.video_metadata['has_dovi'] else ''}",
-                )
-
-            return self.probe_data
+        resolved = self.input_file.resolve()
+        st = resolved.stat()
+        key = {"path": str(resolved), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        cache_file = PROBE_CACHE_DIR / f"{hashlib.sha1(str(resolved).encode()).hexdigest()}.json"  # noqa: S324
+
+        with suppress(OSError, ValueError, KeyError):
+            cached = json.loads(cache_file.read_text(encoding="utf-8"))
+            if cached["key"] == key:
+                logger.info("Using cached probe data")
+                return self.load_probe_data(cast("ProbeData", cached["probe_data"]))
 
+        try:
+            cmd = [find_tool("ffprobe"), *_PROBE_OPTIONS, str(self.input_file)]
+
+            # Parse straight from the pipe instead of buffering and decoding the whole output first
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+                if process.stdout is None:
+                    raise ProbeError("Failed to open stdout pipe")
+                probe_data = json.load(process.stdout)
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, cmd)
         except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
             raise ProbeError(f"Probe failed: {e!s}") from e
 
+        with suppress(OSError):  # The cache is only an optimization, never fail the run over it
+            PROBE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file and rename so concurrent runs never see a partially written cache
+            with tempfile.NamedTemporaryFile(
+                "w",
+                dir=PROBE_CACHE_DIR,
+                suffix=".tmp",
+                delete=False,
+                encoding="utf-8",
+            ) as f:
+                json.dump({"key": key, "probe_data": probe_data}, f)
+            Path(f.name).replace(cache_file)
+
+        # Ensure the loaded data matches our expected type
+        return self.load_probe_data(cast("ProbeData", probe_data))
+
+    def load_probe_data(self, probe_data: ProbeData) -> ProbeData:
+        """
+        Sets the probe data (from probe_file or a cached probe) and derives file and video metadata from it.
+
+        Args:
+            probe_data (ProbeData): Parsed ffprobe JSON output for the input file.
+
+        Returns:
+            ProbeData: The same probe data.
+        """
+        self.probe_data = probe_data
+        # Stream maps and bitrate depend on the probe
+        self._argv_template.clear()
+        self._target_bitrate = None
+        self._commands.clear()
+        format_info = self.probe_data["format"]
+
+        # Basic file info
+        self.input_size_gb = float(format_info["size"]) / (1024**3)
+        self.duration = float(format_info["duration"])
+
+        # Split streams by type once; the first video stream is the one we encode
+        self.video_stream = None
+        self.audio_streams = []
+        self.subtitle_streams = []
+        for stream in self.probe_data["streams"]:
+            stream_type = stream.get("codec_type", "")
+            if stream_type == "video" and self.video_stream is None:
+                self.video_stream = stream
+            elif stream_type == "audio":
+                self.audio_streams.append(stream)
+            elif stream_type == "subtitle":
+                self.subtitle_streams.append(stream)
+
+        video_stream = self.video_stream
+        if video_stream:
+            # Detect HDR/DoVi features
+            self.video_metadata = {
+                "codec_name": video_stream.get("codec_name", ""),
+                "height": int(video_stream.get("height", 0)),
+                "width": int(video_stream.get("width", 0)),
+                "frame_rate": _parse_frame_rate(str(video_stream.get("r_frame_rate", "24/1"))),
+                "is_hdr10": video_stream.get("color_transfer") == "smpte2084",
+                "is_hlg": video_stream.get("color_transfer") == "arib-std-b67",
+                "has_dovi": any("dovi_configuration_record" in str(s) for s in self.probe_data["streams"]),
+                "color_space": video_stream.get("color_space", ""),
+                "color_transfer": video_stream.get("color_transfer", ""),
+                "color_primaries": video_stream.get("color_primaries", ""),
+                "bits_per_raw_sample": int(video_stream.get("bits_per_raw_sample", 8)),  # type: ignore
+                "profile": video_stream.get("profile", ""),
+            }
+
+            # Detect DoVi profile if present
+            if self.video_metadata["has_dovi"]:
+                side_data = video_stream.get("side_data_list", [])
+                for data in side_data:  # type: ignore
+                    if "dovi_configuration_record" in str(data):
+                        self.video_metadata["dovi_profile"] = data.get("dovi_profile", 0)
+                        self.video_metadata["dovi_bl_present_flag"] = data.get("dovi_bl_present_flag", 1)
+                        self.video_metadata["dovi_el_present_flag"] = data.get("dovi_el_present_flag", 0)
+                        break
+
+            logger.info(f"Input: {self.input_size_gb:.2f}GB, Duration: {self.duration:.2f}s")
+            logger.info(
+                f"Video: {self.video_metadata['width']}x{self.video_metadata['height']}, "
+                f"{'HDR10' if self.video_metadata['is_hdr10'] else ''}"
+                f"{'Dolby Vision' if self.video_metadata['has_dovi'] else ''}",
+            )
+
+        return self.probe_data
+
     def _get_stream_indexes(self) -> dict[str, list[int]]:
         if not self.probe_data:
             self.probe_file()
@@ -145,19 +273,18 @@ class VideoProcessor:
             raise ValueError("Probe data is still None after probe_file()")
 
         indexes: dict[str, list[int]] = {"video": [], "audio": [], "subtitle": []}
+        english_only = {"audio": self.config.english_audio_only, "subtitle": self.config.english_subtitles_only}
         for stream in self.probe_data["streams"]:
             stream_type = stream.get("codec_type", "")
-            if stream_type not in indexes:
+            selected = indexes.get(stream_type)
+            if selected is None:
                 continue
-
-            if (self.config.english_audio_only and stream_type == "audio") or (
-                self.config.english_subtitles_only and stream_type == "subtitle"
+            if (
+                english_only.get(stream_type)
+                and stream.get("tags", {}).get("language", "").lower() not in ENGLISH_LANGUAGES
             ):
-                tags = stream.get("tags", {})
-                if tags.get("language", "").lower() in ["eng", "english"]:
-                    indexes[stream_type].append(stream["index"])
-            else:
-                indexes[stream_type].append(stream["index"])
+                continue
+            selected.append(stream["index"])
 
         return indexes
 
@@ -168,10 +295,7 @@ class VideoProcessor:
         if not self.probe_data:
             self.probe_file()
 
-        if self.probe_data is None or "streams" not in self.probe_data:
-            return  # No streams found, so no Dolby Vision metadata
-
-        video_stream = next((s for s in self.probe_data["streams"] if s.get("codec_type") == "video"), None)
+        video_stream = self.video_stream
         if video_stream is None:
             return  # No video stream found, so no Dolby Vision metadata
 
@@ -223,11 +347,7 @@ class VideoProcessor:
         vm = self.video_metadata  # shorthand reference
 
         # Base resolution multiplier (adjusted for content type)
-        resolution_multiplier = {
-            2160: 1.0,
-            1440: 0.75,
-            1080: 0.55,
-        }.get(vm["height"], 0.35)
+        resolution_multiplier = RESOLUTION_MULTIPLIERS[bisect.bisect_right(RESOLUTION_HEIGHTS, vm["height"])]
 
         # HDR/DoVi content type multiplier
         content_type_multiplier = 1.0
@@ -260,9 +380,8 @@ class VideoProcessor:
         codec_multiplier = hevc_efficiency_multiplier if codec_name == "hevc" else 1.0  # HEVC is more efficient
 
         # Calculate audio bitrate requirements
-        audio_streams = sum(1 for s in self.probe_data["streams"] if s["codec_type"] == "audio")
         audio_bitrate = int(self.config.audio_bitrate.rstrip("k")) * 1000
-        total_audio_bits = audio_streams * audio_bitrate * self.duration if self.config.copy_audio else 0
+        total_audio_bits = len(self.audio_streams) * audio_bitrate * self.duration if self.config.copy_audio else 0
 
         # Apply all multipliers to calculate target video bitrate
         target_video_bits = (
@@ -296,6 +415,19 @@ class VideoProcessor:
 
         return target_bitrate
 
+    @property
+    def target_bitrate(self) -> int:
+        """Target video bitrate, calculated on first access."""
+        if self._target_bitrate is None:
+            self._target_bitrate = self._calculate_bitrate()
+        return self._target_bitrate
+
+    def command(self, output_path: Path) -> list[str]:
+        """FFmpeg command for encoding to output_path, built on first use per output."""
+        if output_path not in self._commands:
+            self._commands[output_path] = self._build_command(output_path, self.target_bitrate)
+        return self._commands[output_path]
+
     def _build_command(self, output_path: Path, target_bitrate: int) -> list[str]:
         """Build FFmpeg command with the given parameters.
 
@@ -310,38 +442,31 @@ class VideoProcessor:
         self._check_hardware_support()
 
         video_stream = self._get_video_stream()
-        stream_indexes = self._get_stream_indexes()
         use_hw = False
         if self.config.use_hardware_acceleration and self.hw_support is not None:
             use_hw = self.hw_support
 
-        cmd = self._build_base_command(stream_indexes)
-        cmd.extend(self._build_video_encoding_settings(use_hw, target_bitrate, video_stream))
-        cmd.extend(self._build_audio_subtitle_settings())
+        prefix, suffix = self._get_argv_template(use_hw)
+        return [
+            *prefix,
+            *self._build_video_encoding_settings(use_hw, target_bitrate, video_stream),
+            *suffix,
+            str(output_path),
+        ]
 
-        if use_hw and self.has_dolby_vision:  # hdr metadata
-            cmd.extend(dolby_vision_metadata)
-            cmd.extend(
-                [
-                    str(output_path),
-                ],
-            )
-            return cmd
-
-        # Output settings
-        cmd.extend(hevc_metadata)
-        cmd.extend(
-            [
-                str(output_path),
-            ],
-        )
-        return cmd
+    def _get_argv_template(self, use_hw: bool) -> tuple[tuple[str, ...], tuple[str, ...]]:
+        """Return the parts of the FFmpeg command that don't depend on the bitrate, building them once."""
+        if use_hw not in self._argv_template:
+            prefix = tuple(self._build_base_command(self._get_stream_indexes()))
+            metadata = dolby_vision_metadata if use_hw and self.has_dolby_vision else hevc_metadata  # hdr metadata
+            suffix = (*self._build_audio_subtitle_settings(), *metadata)
+            self._argv_template[use_hw] = (prefix, suffix)
+        return self._argv_template[use_hw]
 
     def _check_hardware_support(self) -> None:
         """Check if hardware encoding is supported."""
         if self.hw_support is None:
-            ffmpeg_output = subprocess.run(["ffmpeg", "-encoders"], capture_output=True, text=True, check=False).stdout
-            self.hw_support = self.config.hardware_encoder in ffmpeg_output
+            self.hw_support = self.config.hardware_encoder in ffmpeg_encoders()
 
     def _get_video_stream(self) -> StreamDict:
         """Get the video stream information.
@@ -352,28 +477,22 @@ class VideoProcessor:
         Raises:
             ValueError: If no video stream is found or probe data is not available
         """
-        if self.probe_data is not None:
-            video_stream = next((s for s in self.probe_data["streams"] if s["codec_type"] == "video"), None)
-            if not video_stream:
-                raise ValueError("No video stream found")
-            return video_stream
-        raise ValueError("Probe data is not available")
+        if self.probe_data is None:
+            raise ValueError("Probe data is not available")
+        if self.video_stream is None:
+            raise ValueError("No video stream found")
+        return self.video_stream
 
     def _build_base_command(self, stream_indexes: dict[str, list[int]]) -> list[str]:
         """Build the base FFmpeg command with input and stream mapping."""
-        cmd = ["ffmpeg", "-y", "-hwaccel", "videotoolbox", "-i", str(self.input_file)]
-
-        # Map streams
-        cmd.extend(["-map", f"0:{stream_indexes['video'][0]}"])
-
+        mapped = [stream_indexes["video"][0]]
         if self.config.copy_audio:
-            for idx in stream_indexes["audio"]:
-                cmd.extend(["-map", f"0:{idx}"])
-
+            mapped += stream_indexes["audio"]
         if self.config.copy_subtitles:
-            for idx in stream_indexes["subtitle"]:
-                cmd.extend(["-map", f"0:{idx}"])
+            mapped += stream_indexes["subtitle"]
 
+        cmd = [find_tool("ffmpeg"), *_INPUT_OPTIONS, str(self.input_file)]
+        cmd += [arg for idx in mapped for arg in ("-map", f"0:{idx}")]  # Map streams
         return cmd
 
     def _build_dolby_vision_settings(self, target_bitrate: int) -> list[str]:
@@ -407,7 +526,7 @@ class VideoProcessor:
             "-max_ref_frames",
             self.config.max_ref_frames,
             "-quality",
-            self.config.quality_preset.value,
+            self.config.quality_preset,
             "-field_order",
             "progressive",
             "-probesize",
@@ -440,7 +559,7 @@ class VideoProcessor:
             "-profile:v",
             "main10",
             "-quality",
-            self.config.quality_preset.value,
+            self.config.quality_preset,
             "-colorspace",
             video_stream.get("color_space", "bt2020nc"),
             "-field_order",
@@ -468,19 +587,19 @@ class VideoProcessor:
             "repeat-headers=1",
             f"max-cll={self.config.hdr_params['max_cll']}",
             f"master-display={self.config.hdr_params['master_display']}",
+            f"pools={self.config.threads}",
         ]
 
         return [
             "-c:v",
             self.config.fallback_encoder,
             "-preset",
-            self.config.preset.value,
+            self.config.preset,
+            "-threads",
+            str(self.config.threads),
             "-x265-params",
             ":".join(x265_params),
-            "-profile:v",
-            "main10",
-            "-pix_fmt",
-            "yuv420p10le",
+            *_SOFTWARE_OUTPUT_FORMAT,
         ]
 
     def _build_video_encoding_settings(self, use_hw: bool, target_bitrate: int, video_stream: StreamDict) -> list[str]:
@@ -494,30 +613,10 @@ class VideoProcessor:
 
     def _build_audio_subtitle_settings(self) -> list[str]:
         """Build audio and subtitle encoding settings."""
-        cmd = []
-
-        if self.config.copy_audio:
-            cmd.extend(
-                [
-                    "-c:a",
-                    "copy",
-                    "-b:a",
-                    self.config.audio_bitrate,
-                ],
-            )
-        else:
-            cmd.extend(
-                [
-                    "-c:a",
-                    self.config.audio_codec,
-                    "-b:a",
-                    self.config.audio_bitrate,
-                ],
-            )
-
+        audio_codec = "copy" if self.config.copy_audio else self.config.audio_codec
+        cmd = ["-c:a", audio_codec, "-b:a", self.config.audio_bitrate]
         if self.config.copy_subtitles:
-            cmd.extend(["-c:s", "copy"])
-
+            cmd += _COPY_SUBTITLES
         return cmd
 
     def _validate_output_path(self, output_path: Union[str, Path]) -> Path:
@@ -525,44 +624,133 @@ class VideoProcessor:
         Validate the output path and ensure it doesn't already exist with content.
         """
         output_path = Path(output_path)
-        if output_path.exists() and output_path.stat().st_size > 0:
+        try:
+            size = output_path.stat().st_size
+        except FileNotFoundError:
+            return output_path
+        if size > 0:
             raise FileExistsError(f"Output file exists: {output_path}")
         return output_path
 
-    def _monitor_encoding_process(self, process: Popen[str], encoding_timeout_seconds: int) -> None:
-        if process.stderr is None:
-            raise EncodingError("Failed to open stderr pipe")
+    def _encoder_cpus(self) -> frozenset[int] | None:
+        """CPUs ffmpeg runs on when the driver is kept off them (Linux with enough cores), otherwise None."""
+        if sys.platform != "linux" or len(_AVAILABLE_CPUS) < MIN_CPUS_FOR_ISOLATION:
+            return None
+        return _AVAILABLE_CPUS - {min(_AVAILABLE_CPUS)}
+
+    def _isolate_driver(self) -> set[int] | None:
+        """
+        Keep the (mostly idle) driver off the encoder's cores.
+
+        On Linux every driver thread (including the log listener and flush threads) is pinned to the
+        one CPU ffmpeg was kept off, so the progress loop never competes with the encoder threads.
+        Elsewhere this is a no-op.
+
+        Returns:
+            set[int] | None: The driver's previous affinity, to restore once the encode is over,
+            or None if the driver was not pinned.
+        """
+        if self._encoder_cpus() is None:
+            return None
+        driver_affinity = os.sched_getaffinity(0)
+        try:
+            _set_process_affinity({min(_AVAILABLE_CPUS)})
+        except OSError as e:
+            logger.warning(f"Could not set CPU affinity for the driver: {e}")
+        return driver_affinity
+
+    def _prepare_pipe(self, fd: int) -> None:
+        """Make an ffmpeg output pipe non-blocking, and larger on Linux so ffmpeg never blocks between our reads."""
+        os.set_blocking(fd, False)
+        if sys.platform == "linux":
+            with suppress(OSError):
+                fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+
+    def _read_lines(self, fd: int, pending: dict[int, bytes]) -> bytes | None:
+        """
+        Read what is available on fd and return the complete lines, or None once the pipe is closed.
+        A trailing partial line is kept in pending[fd] for the next read.
+        """
+        try:
+            chunk = os.read(fd, PIPE_CHUNK_SIZE)
+        except BlockingIOError:
+            return b""
+        if not chunk:
+            return None
+        data = pending[fd] + chunk
+        cut = max(data.rfind(b"\n"), data.rfind(b"\r")) + 1
+        complete, pending[fd] = data[:cut], data[cut:]
+        return complete
+
+    def _log_progress(self, lines: bytes) -> bool:
+        """Log the newest frame count from -progress key=value lines, returning whether there was one."""
+        frame = None
+        for line in lines.split(b"\n"):
+            name, _, value = line.partition(b"=")
+            if name == b"frame":
+                frame = value
+        if frame is None:
+            return False
+        logger.log_frame(frame.strip().decode("ascii"))
+        return True
+
+    def _log_errors(self, lines: bytes) -> None:
+        """Log the error lines from ffmpeg's stderr."""
+        if _ERROR_RE.search(lines):
+            for line in _LINE_END_RE.split(lines):
+                if _ERROR_RE.search(line):
+                    logger.error(line.decode("utf-8", "replace").strip())
+
+    def _monitor_encoding_process(self, process: Popen[bytes], encoding_timeout_seconds: int) -> None:
+        if process.stdout is None or process.stderr is None:
+            raise EncodingError("Failed to open ffmpeg output pipes")
+
+        progress_fd, log_fd = process.stdout.fileno(), process.stderr.fileno()
+        pending = {progress_fd: b"", log_fd: b""}
+        for fd in pending:
+            self._prepare_pipe(fd)
 
         last_progress = time.time()
-        progress_pattern = re.compile(r"frame=\s*(\d+)")
-
-        while True:
-            line = process.stderr.readline()
-            if not line and process.poll() is not None:
-                break
-
-            if line:
-                if "frame=" in line:
-                    last_progress = time.time()
-                    if match := progress_pattern.search(line):
-                        logger.log_frame(match.group(1))
-                elif "error" in line.lower():
-                    logger.error(line.strip())
-
-            if time.time() - last_progress > encoding_timeout_seconds:
-                process.terminate()
-                raise EncodingError("Encoding stalled")
-
-    def _verify_output(self, output_path: Path, process: Popen[str]) -> None:
+
+        with selectors.DefaultSelector() as selector:
+            for fd in pending:
+                selector.register(fd, selectors.EVENT_READ)
+            while selector.get_map():  # Until ffmpeg has closed both pipes
+                for selector_key, _ in selector.select(timeout=1):
+                    lines = self._read_lines(selector_key.fd, pending)
+                    if lines is None:  # EOF on this pipe
+                        selector.unregister(selector_key.fd)
+                    elif selector_key.fd == progress_fd:
+                        if self._log_progress(lines):
+                            last_progress = time.time()
+                    else:
+                        self._log_errors(lines)
+
+                # Checked on every wakeup, so a silently hung ffmpeg is caught too
+                if time.time() - last_progress > encoding_timeout_seconds:
+                    process.terminate()
+                    raise EncodingError("Encoding stalled")
+
+        process.wait()
+
+    def _has_container_header(self, output_path: Path) -> bool:
+        """Cheap structural check of the output: an MP4 ftyp box or an MKV EBML header."""
+        with output_path.open("rb") as f:
+            header = f.read(8)
+        return header[4:8] == _MP4_FTYP or header[:4] == _MKV_EBML
+
+    def _verify_output(self, output_path: Path, process: Popen[bytes]) -> None:
         if process.returncode != 0:
             raise EncodingError(f"FFmpeg failed with code {process.returncode}")
 
-        if output_path.exists():
+        try:
             final_size = output_path.stat().st_size / 1024**3
-            logger.info(f"Completed. Output size: {final_size:.2f}GB")
-            subprocess.run(["ffprobe", str(output_path)], check=True, capture_output=True)
-        else:
-            raise EncodingError("Output file not created")
+        except FileNotFoundError as e:
+            raise EncodingError("Output file not created") from e
+        logger.info(f"Completed. Output size: {final_size:.2f}GB")
+        if not self._has_container_header(output_path):
+            logger.warning("Output header not recognized, verifying with ffprobe")
+            subprocess.run([find_tool("ffprobe"), str(output_path)], check=True, capture_output=True)
 
     @retry(
         retry=retry_if_exception_type(EncodingError),
@@ -582,34 +770,64 @@ class VideoProcessor:
             EncodingError: If the encoding process fails.
         """
         encoding_timeout_seconds = 30
+        driver_affinity = None
 
         try:
             output_path = self._validate_output_path(output_path)
+            self._output_path = output_path
 
             if not self.probe_data:
                 self.probe_file()
 
-            target_bitrate = self._calculate_bitrate()
-            cmd = self._build_command(output_path, target_bitrate)
+            cmd = self.command(output_path)
 
             logger.info("Starting encoding...")
+            # The encoder's mask is set in the child before exec, so every thread ffmpeg starts inherits it.
+            # The callback is a single syscall, so it is safe to run in a child forked from a threaded process
+            encoder_cpus = self._encoder_cpus()
+            set_encoder_affinity = functools.partial(os.sched_setaffinity, 0, encoder_cpus) if encoder_cpus else None
             process = subprocess.Popen(
                 cmd,
-                stdout=subprocess.PIPE,
+                stdout=subprocess.PIPE,  # -progress pipe:1
                 stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
+                bufsize=0,  # Both pipes are drained with os.read, bypassing any Python-level buffer
+                preexec_fn=set_encoder_affinity,  # noqa: PLW1509
             )
+            self._process = process
 
+            driver_affinity = self._isolate_driver()
             self._monitor_encoding_process(process, encoding_timeout_seconds)
             self._verify_output(output_path, process)
 
         except Exception as e:
             logger.error(f"Encoding failed: {e!s}")
-            output_path_obj = Path(output_path)  # Convert to Path to handle Union type
-            if output_path_obj.exists():
-                output_path_obj.unlink()
+            Path(output_path).unlink(missing_ok=True)  # Convert to Path to handle Union type
             raise
+        finally:
+            # The output is finished (or already removed) from here on, terminate() must not delete it
+            self._process = None
+            self._output_path = None
+            if driver_affinity is not None:
+                # Give the driver its cores back for verification, retries and the next file
+                with suppress(OSError):
+                    _set_process_affinity(driver_affinity)
+
+    def terminate(self) -> None:
+        """
+        Stop a running encode and remove its partial output.
+
+        Safe to call from a signal handler; only an encode still in flight has its output removed.
+        """
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            if self._output_path is not None:
+                self._output_path.unlink(missing_ok=True)
 
 
 if __name__ == "__main__":